@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Mention counts and deaths-per-mention ratios for every publication at once.
+All publications are concatenated with a categorical `publication` column and reduced, in a single groupby, to a cube of
+sentence counts per (publication, date, victim, responsible). Every summary and daily series is then a slice of that cube.
+The cube is cached on disk, keyed by a hash of the sentence csvs, so it is only rebuilt when the labelled data changes.
+"""
+
+import os
+import hashlib
+import argparse
+import pandas as pd
+import storage
+from files import atomic_write
+
+PUBLICATIONS = {'globe': 'The Globe and Mail', 'star': 'The Toronto Star', 'post': 'The National Post'}
+DATE_RANGE = ['2023-10-07', '2023-11-24'] # inclusive, up to the beginning of the humanitarian pause
+
+ocha_path = '../data/ocha.csv'
+cache_dir = '../cache/analysis'
+CUBE_VERSION = 1 # bump when the cube layout changes
+
+# labels counted as a mention of each group
+VICTIMS = {'palestinian': ['Palestinian', 'Both'], 'israeli': ['Israeli', 'Both']}
+RESPONSIBLE = {'hamas': ['Hamas', 'Both'], 'israel': ['Israel', 'Both']}
+
+
+def load_sentences(publications=PUBLICATIONS):
+    """returns the labelled sentences of every publication in one dataframe with a categorical `publication` column"""
+    df = pd.concat([storage.load_sentences(name).assign(publication=name) for name in publications], ignore_index=True)
+    df['publication'] = pd.Categorical(df['publication'], categories=list(publications))
+    return df
+
+def input_hash(publications=PUBLICATIONS):
+    """returns a hash of the sentence csvs the cube is built from"""
+    digest = hashlib.sha256(f'cube-{CUBE_VERSION}'.encode())
+    for name in publications:
+        with open(storage.csv_path(name, 'sentences'), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def build_cube(df):
+    """
+    Reduces sentences to mention counts per (publication, date, victim, responsible), plus the (publication, url, date)
+    of every article. Counts are kept per publication timestamp rather than per day, so date ranges filter exactly like
+    comparing the sentence dates (an end date of '2023-11-24' stops at midnight); daily series are summed from it.
+    """
+    # unlabelled victims or responsible groups are kept, so the other label of the sentence still counts
+    cube = df.groupby(['publication', 'date', 'victim', 'responsible'], observed=True, dropna=False).size().rename('mentions').reset_index()
+    articles = df[['publication', 'url', 'date']].drop_duplicates().reset_index(drop=True)
+    return cube, articles
+
+def load_cube(publications=PUBLICATIONS, refresh=False):
+    """returns (cube, articles), from the cache if the sentence csvs haven't changed since it was built"""
+    path = os.path.join(cache_dir, f'cube-{input_hash(publications)[:16]}.pkl')
+    if not refresh and os.path.exists(path):
+        return pd.read_pickle(path)
+
+    cube, articles = build_cube(load_sentences(publications))
+
+    with atomic_write(path) as tmp_path:
+        pd.to_pickle((cube, articles), tmp_path)
+
+    return cube, articles
+
+
+def in_range(df, date_range=DATE_RANGE):
+    """returns the rows of `df` whose date is within `date_range` (inclusive)"""
+    return df[(df['date'] >= pd.Timestamp(date_range[0])) & (df['date'] <= pd.Timestamp(date_range[1]))]
+
+def group_mentions(cube):
+    """returns the cube with one column of mention counts per victim and responsible group"""
+    columns = {group: cube['mentions'].where(cube['victim'].isin(labels), 0) for group, labels in VICTIMS.items()}
+    columns.update({group: cube['mentions'].where(cube['responsible'].isin(labels), 0) for group, labels in RESPONSIBLE.items()})
+    return cube[['publication', 'date']].assign(**columns)
+
+def ocha_deaths(date_range=DATE_RANGE, path=ocha_path):
+    """returns the (palestinian, israeli) deaths reported by the OCHA within `date_range`"""
+    ocha = pd.read_csv(path, index_col=0, parse_dates=['date']).set_index('date')[['pal_total', 'isr_total']].ffill()
+    end = ocha[ocha.index <= pd.Timestamp(date_range[1])]
+    before = ocha[ocha.index < pd.Timestamp(date_range[0])]
+    totals = end.iloc[-1] - (before.iloc[-1] if len(before) else 0)
+    return int(totals['pal_total']), int(totals['isr_total'])
+
+def summarize(cube, articles, date_range=DATE_RANGE):
+    """returns mention counts and deaths-per-mention ratios for each publication within `date_range`"""
+    pal_ocha, isr_ocha = ocha_deaths(date_range)
+    mentions = group_mentions(in_range(cube, date_range)).groupby('publication', observed=False)[[*VICTIMS, *RESPONSIBLE]].sum()
+
+    summary = pd.DataFrame({'articles': in_range(articles, date_range).groupby('publication', observed=False)['url'].nunique()})
+    summary['israeli_death_mentions'] = mentions['israeli']
+    summary['palestinian_death_mentions'] = mentions['palestinian']
+    summary['israeli_deaths_per_mention'] = isr_ocha / mentions['israeli']
+    summary['palestinian_deaths_per_mention'] = pal_ocha / mentions['palestinian']
+    summary['israel_responsible_mentions'] = mentions['israel']
+    summary['hamas_responsible_mentions'] = mentions['hamas']
+    summary['israeli_deaths_per_hamas_mention'] = isr_ocha / mentions['hamas']
+    summary['palestinian_deaths_per_israel_mention'] = pal_ocha / mentions['israel']
+    summary['israeli_deaths_blamed_on_hamas'] = mentions['hamas'] / mentions['israeli']
+    summary['palestinian_deaths_blamed_on_israel'] = mentions['israel'] / mentions['palestinian']
+    return summary
+
+def daily_mentions(cube, publication, kind='deaths', date_range=DATE_RANGE):
+    """
+    Returns daily mention counts for one publication over every day of `date_range`, with a column per group:
+    'palestinian' and 'israeli' for kind='deaths', or 'hamas' and 'israel' for kind='blame'.
+    """
+    groups = list(VICTIMS) if kind == 'deaths' else list(RESPONSIBLE)
+    mentions = group_mentions(in_range(cube[cube['publication'] == publication], date_range))
+    daily = mentions.groupby(mentions['date'].dt.floor('D'))[groups].sum()
+    return daily.reindex(pd.date_range(date_range[0], date_range[1]), fill_value=0).astype('int')
+
+def print_summary(summary, date_range=DATE_RANGE):
+    """prints the summary of each publication"""
+    for row in summary.itertuples():
+        publication = row.Index
+        print(f"{PUBLICATIONS.get(publication, publication)}: {date_range[0]} to {date_range[1]} ({row.articles} articles)")
+        print('----'*10)
+        print(f"\n{row.israeli_death_mentions} mentions of Israeli deaths")
+        print(f"{row.palestinian_death_mentions} mentions of Palestinian deaths")
+        print(f"\n{row.israeli_deaths_per_mention:.2f} Israeli deaths per mention")
+        print(f"{row.palestinian_deaths_per_mention:.2f} Palestinian deaths per mention")
+        print(f"\n{row.israel_responsible_mentions} mentions of Israeli responsibility")
+        print(f"{row.hamas_responsible_mentions} mentions of Hamas responsibility")
+        print(f"\n{row.israeli_deaths_per_hamas_mention:.2f} Israeli deaths per mention of Hamas responsibility")
+        print(f"{row.palestinian_deaths_per_israel_mention:.2f} Palestinian deaths per mention of Israel responsibility")
+        print(f"\n{row.israeli_deaths_blamed_on_hamas:.2%} of Israeli death mentions blamed on Hamas")
+        print(f"{row.palestinian_deaths_blamed_on_israel:.2%} of Palestinian death mentions blamed on Israel\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Count mentions of deaths and responsibility for every publication.')
+    parser.add_argument('--start', default=DATE_RANGE[0], help='first date (inclusive)')
+    parser.add_argument('--end', default=DATE_RANGE[1], help='last date (inclusive)')
+    parser.add_argument('--publications', nargs='+', choices=list(PUBLICATIONS), default=list(PUBLICATIONS))
+    parser.add_argument('--output', help='also save the summary table to this csv')
+    parser.add_argument('--refresh', action='store_true', help='rebuild the cached count cube')
+    args = parser.parse_args()
+
+    date_range = [args.start, args.end]
+    cube, articles = load_cube(refresh=args.refresh)
+    summary = summarize(cube, articles, date_range).loc[args.publications]
+    print_summary(summary, date_range)
+
+    if args.output:
+        summary.to_csv(args.output)
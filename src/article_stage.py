@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Fused per-article stage: fetches and parses each unique article url once and runs every registered extractor over that one page.
+Extractor results are memoized next to the page cache, so a later script that needs another extractor's output
+(e.g. extract_sentences after the Star keyword check) gets it without fetching or parsing the page again.
+The memo is keyed by a hash of the extractor code, so changing an extractor starts a fresh memo instead of serving stale results.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import inspect
+import threading
+from bs4 import BeautifulSoup
+import cache
+from metrics import metrics
+import parsing
+from parsing import parse_tree
+from fetch import fetch_as_completed, MAX_WORKERS, PER_HOST_LIMIT, HOST_DELAY
+
+
+class Page:
+    """a fetched article: its url, html, and lxml and BeautifulSoup trees built on first use and shared by every extractor"""
+
+    def __init__(self, url, html):
+        self.url = url
+        self.html = html
+        self._soup = None
+        self._tree = None
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = parse_tree(self.html)
+        return self._tree
+
+    @property
+    def soup(self):
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.html, 'lxml')
+        return self._soup
+
+
+class ArticleStage:
+    """
+    Runs pluggable extractors, functions that take a Page and return a json-serializable value, over each article page.
+    An extractor that raises gives None for that article.
+    """
+
+    def __init__(self, name, extractors=None, raise_for_status=False):
+        self.name = name
+        self.extractors = dict(extractors or {})
+        self.raise_for_status = raise_for_status
+        self._memo = None
+        self._memo_cache = None
+        self._lock = threading.Lock()
+
+    def register(self, name, extractor):
+        """adds an extractor to run on every page"""
+        self.extractors[name] = extractor
+
+    def version(self):
+        """returns a short hash of the source of every extractor's module and of parsing.py, which they share"""
+        modules = {sys.modules[extractor.__module__] for extractor in self.extractors.values()} | {parsing}
+        sources = sorted(inspect.getsource(module) for module in modules)
+        return hashlib.sha256('\n'.join(sources).encode('utf-8')).hexdigest()[:12]
+
+    def memo(self):
+        """
+        Returns the on-disk store of extractor results, kept alongside the shared page cache (None if caching is off).
+        Each version of the extractor code gets its own directory, cache/extracted/<name>/<version>/.
+        """
+        with self._lock:
+            if self._memo_cache is not cache.cache:
+                self._memo_cache = cache.cache
+                if isinstance(cache.cache, cache.NoCache):
+                    self._memo = None
+                else:
+                    memo_dir = os.path.join(os.path.dirname(cache.cache.cache_dir), 'extracted', self.name, self.version())
+                    self._memo = cache.HTMLCache(memo_dir, max_bytes=cache.cache.max_bytes)
+            return self._memo
+
+    def extract(self, url):
+        """returns {extractor name: value} for `url`, fetching and parsing the page at most once"""
+        memo = self.memo()
+        if memo is not None:
+            stored = memo.get(url)
+            if stored is not None:
+                results = json.loads(stored)
+                if all(name in results for name in self.extractors):
+                    metrics.count('memo.hits')
+                    return results
+            metrics.count('memo.misses')
+
+        try:
+            with metrics.timer('fetch', publication=self.name, url=url):
+                html = cache.get_html(url, raise_for_status=self.raise_for_status)
+        except Exception as e:
+            metrics.failure('fetch', e, publication=self.name, url=url)
+            raise
+
+        page = Page(url, html)
+        results = {}
+        failed = False
+        for name, extractor in self.extractors.items():
+            try:
+                with metrics.timer('parse', publication=self.name, extractor=name, url=url):
+                    results[name] = extractor(page)
+            except Exception as e:
+                metrics.failure('parse', e, publication=self.name, extractor=name, url=url)
+                results[name] = None
+                failed = True
+
+        # pages that didn't fully parse (e.g. error pages) are retried next time rather than remembered
+        if memo is not None and not failed:
+            memo.put(url, json.dumps(results))
+
+        return results
+
+    def run(self, urls, max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT, delay=HOST_DELAY, desc=None):
+        """
+        Runs every extractor over each unique url on the throttled thread pool.
+        Returns a list of (results, exception) tuples in the same order as `urls`; repeated urls share one fetch.
+        """
+        unique_urls = list(dict.fromkeys(urls))
+        jobs = [(self.extract, url) for url in unique_urls]
+        by_url = {}
+        for j, results, error in fetch_as_completed(jobs, max_workers, per_host_limit, delay, desc):
+            by_url[unique_urls[j]] = (results, error)
+
+        return [by_url[url] for url in urls]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Checks that the prefiltered, batched fatal_sentence_checks gives exactly the same results as the original per-sentence
+fatal_sentence_check on the saved sentence corpora, and measures the speedup.
+Article titles are included alongside the extracted sentences so the corpus also has sentences that don't match.
+"""
+
+import time
+import pandas as pd
+import nltk
+from nltk.stem import WordNetLemmatizer
+from extract_sentences import VERBS, NOUNS, ALL_FATAL_VERBS, FATAL_NOUNS, fatal_sentence_checks, fatal_prefilter, ensure_nltk_data
+
+corpus_paths = {'globe': ('../data/globe_sentences.csv', '../data/globe_article_list.csv'),
+                'star': ('../data/star_sentences.csv', '../data/star_article_list.csv'),
+                'post': ('../data/post_sentences.csv', '../data/post_article_list.csv')}
+
+def reference_fatal_sentence_check(sentence, lemmatizer=WordNetLemmatizer(), verbs=VERBS, fatal_verbs=ALL_FATAL_VERBS, nouns=NOUNS, fatal_nouns=FATAL_NOUNS):
+    """the original fatal_sentence_check, kept here to compare against"""
+    fatal = False
+    words = nltk.word_tokenize(sentence)
+    tagged = nltk.pos_tag(words)
+
+    for tag in tagged:
+        word = tag[0]
+        pos = tag[1]
+
+        if pos in verbs:
+            lemma = lemmatizer.lemmatize(word, 'v')
+            if lemma in fatal_verbs:
+                fatal = True
+        elif pos in nouns:
+            lemma = lemmatizer.lemmatize(word, 'n')
+            if lemma in fatal_nouns:
+                fatal = True
+
+    return fatal
+
+if __name__ == "__main__":
+    ensure_nltk_data()
+    # build the prefilter up front so it isn't counted in the timings
+    pattern, forms = fatal_prefilter(tuple(ALL_FATAL_VERBS), tuple(FATAL_NOUNS))
+    print(f'Prefilter built from {len(forms)} surface forms')
+
+    for name, (sentences_path, articles_path) in corpus_paths.items():
+        sentences = pd.read_csv(sentences_path, index_col=0)['sentence'].tolist()
+        sentences += pd.read_csv(articles_path)['title'].tolist()
+
+        start = time.perf_counter()
+        reference = [reference_fatal_sentence_check(sentence) for sentence in sentences]
+        reference_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast = fatal_sentence_checks(sentences)
+        fast_time = time.perf_counter() - start
+
+        mismatches = [sentence for sentence, a, b in zip(sentences, reference, fast) if a != b]
+        rejected = sum(not pattern.search(sentence) for sentence in sentences)
+
+        print(f'{name}: {len(sentences)} sentences, {sum(reference)} fatal, {rejected / len(sentences):.1%} rejected by prefilter')
+        print(f'    reference: {reference_time:.2f}s ({len(sentences) / reference_time:.0f} sentences/s)')
+        print(f'    fast path: {fast_time:.2f}s ({len(sentences) / fast_time:.0f} sentences/s), {reference_time / fast_time:.1f}x speedup')
+
+        if mismatches:
+            raise AssertionError(f'{len(mismatches)} {name} sentences differ, e.g. {mismatches[0]!r}')
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Measures how throughput of the process-pool NLP stage scales with worker count.
+Article texts are rebuilt offline by joining the saved sentences of each article in data/*_sentences.csv and article titles.
+"""
+
+import os
+import time
+import argparse
+import pandas as pd
+from extract_sentences import find_fatal_sentences_parallel, ensure_nltk_data
+
+sentences_paths = ['../data/globe_sentences.csv', '../data/star_sentences.csv', '../data/post_sentences.csv']
+
+def load_article_texts(paths=sentences_paths, copies=1):
+    """rebuilds one text per article from saved sentence csvs, repeated `copies` times for a larger corpus"""
+    df = pd.concat([pd.read_csv(path, index_col=0) for path in paths])
+    texts = [group['title'].iloc[0] + '. ' + ' '.join(group['sentence']) for _, group in df.groupby('url', sort=False)]
+    return texts * copies
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the NLP stage of extract_sentences at different worker counts.')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--copies', type=int, default=1, help='repeat the corpus to make runs longer')
+    args = parser.parse_args()
+    ensure_nltk_data()
+
+    texts = load_article_texts(copies=args.copies)
+    print(f'{len(texts)} article texts')
+
+    worker_counts = sorted({1, *[2**i for i in range(1, args.max_workers.bit_length())], args.max_workers})
+    baseline = None
+    reference = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        fatal_lists = find_fatal_sentences_parallel(texts, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        # every worker count must find exactly the same sentences
+        if reference is None:
+            reference = fatal_lists
+        elif fatal_lists != reference:
+            raise AssertionError(f'{workers} workers gave different results than 1 worker')
+
+        throughput = len(texts) / elapsed
+        baseline = baseline or throughput
+        print(f'{workers:>3} workers: {throughput:.1f} articles/s, {throughput / baseline:.2f}x speedup ({throughput / baseline / workers:.0%} efficiency)')
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Compares the parsing strategies in parsing.py (full BeautifulSoup, SoupStrainer and lxml/XPath) on saved pages.
+Pages come from the page cache for the urls in the article lists, or from a directory of fixture .html files.
+Every parser runs on each page its layout applies to (the pages the full BeautifulSoup parser handles), and the
+output of the faster strategies is checked against BeautifulSoup's. Each strategy runs in its own fresh process, untraced,
+and its memory is the growth of the process's peak RSS while parsing, so lxml's C allocations are counted too.
+"""
+
+import os
+import glob
+import time
+import gc
+import argparse
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from cache import add_cache_args, configure_from_args
+import cache
+from parsing import SOUP_PARSERS, parse_html
+
+STRATEGIES = ['soup', 'strainer', 'lxml']
+
+article_paths = ['../data/star_article_list.csv', '../data/post_article_list.csv']
+
+def load_cached_pages(paths=article_paths, limit=None):
+    """returns the html of every article in the article lists that is already in the page cache"""
+    pages = []
+    for path in paths:
+        for url in pd.read_csv(path)['url'].drop_duplicates():
+            html = cache.cache.get(url)
+            if html is not None:
+                pages.append(html)
+            if limit and len(pages) >= limit:
+                return pages
+    return pages
+
+def load_fixture_pages(directory, limit=None):
+    """returns the html of every .html file under `directory`"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '**', '*.html'), recursive=True)):
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    return pages[:limit] if limit else pages
+
+def load_pages(pages_dir=None, cache_dir=None, limit=None):
+    """returns fixture pages from `pages_dir` if given, otherwise the cached pages of the article lists"""
+    if pages_dir:
+        return load_fixture_pages(pages_dir, limit)
+    cache.configure(cache_dir, offline=True)
+    return load_cached_pages(limit=limit)
+
+def applicable_pages(name, pages):
+    """returns the indices of the pages the full BeautifulSoup `name` parser succeeds on, and its output for each"""
+    matched = {}
+    for i, html in enumerate(pages):
+        try:
+            matched[i] = parse_html(name, html, 'soup')
+        except Exception:
+            pass
+    return matched
+
+def peak_rss():
+    """
+    Returns this process's peak RSS in KB. Linux carries ru_maxrss over from the parent into a spawned process,
+    so the process's own high-water mark is read from /proc where it exists.
+    """
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # kilobytes on linux
+
+def run_strategy(name, indices, strategy, pages_dir=None, cache_dir=None, limit=None):
+    """
+    Parses the pages at `indices` with one strategy and returns pages/sec, the growth of peak RSS in MB while parsing,
+    and the outputs. Meant to run in a fresh process that loads its own pages, so the peak only reflects the parsing.
+    """
+    pages = load_pages(pages_dir, cache_dir, limit)
+    pages = [pages[i] for i in indices]
+    gc.collect()
+
+    baseline = peak_rss()
+    outputs = []
+    start = time.perf_counter()
+    for html in pages:
+        outputs.append(parse_html(name, html, strategy))
+    elapsed = time.perf_counter() - start
+    peak = peak_rss()
+
+    return len(pages) / elapsed, (peak - baseline) / 1024, outputs
+
+def time_strategy(name, matched, strategy, pages_dir=None, cache_dir=None, limit=None):
+    """runs one strategy in a fresh, untraced worker process and returns its pages/sec and peak RSS growth in MB, raising if any output differs from soup"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        pages_per_second, peak_mb, outputs = executor.submit(run_strategy, name, list(matched), strategy, pages_dir, cache_dir, limit).result()
+    if outputs != list(matched.values()):
+        raise AssertionError(f'{strategy} {name} output differs from BeautifulSoup')
+    return pages_per_second, peak_mb
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark targeted HTML parsing against full BeautifulSoup.')
+    parser.add_argument('--pages', help='directory of saved .html pages (default: cached pages of the article lists)')
+    parser.add_argument('--limit', type=int, help='use at most this many pages')
+    add_cache_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    pages = load_pages(args.pages, args.cache_dir, args.limit)
+    print(f'{len(pages)} pages')
+
+    print(f"{'parser':<14} {'pages':>5} " +  ' '.join(f"{strategy + ' p/s':>13} {'+MB':>6}" for strategy in STRATEGIES))
+    for name in SOUP_PARSERS:
+        matched = applicable_pages(name, pages)
+        if not matched:
+            continue
+
+        row = f'{name:<14} {len(matched):>5} '
+        for strategy in STRATEGIES:
+            pages_per_second, peak_mb = time_strategy(name, matched, strategy, args.pages, args.cache_dir, args.limit)
+            row += f'{pages_per_second:>13.1f} {peak_mb:>6.1f} '
+        print(row)
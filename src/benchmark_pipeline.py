@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Offline benchmark suite for the extraction pipeline. Each stage runs in a fresh process on saved inputs only:
+the sentence corpora in data/ for the fatal sentence check, and the html fixtures in benchmarks/fixtures/ for the
+article text extractors and the search result parsers. Throughput (sentences/s or pages/s) and peak RSS are reported
+per stage and compared with a stored baseline; the run fails if any stage regresses by more than the threshold.
+
+    python benchmark_pipeline.py --save-baseline   # record a baseline on this machine
+    python benchmark_pipeline.py                   # compare against it
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+fixtures_dir = '../benchmarks/fixtures'
+baseline_path = '../benchmarks/baseline.json'
+sentences_paths = ['../data/globe_sentences.csv', '../data/star_sentences.csv', '../data/post_sentences.csv']
+article_list_paths = {'globe': '../data/globe_article_list.csv', 'star': '../data/star_article_list.csv', 'post': '../data/post_article_list.csv'}
+
+THRESHOLD = 0.2 # fraction of throughput lost (or peak memory gained) that counts as a regression
+MIN_TIME = 2.0 # seconds each stage is repeated for
+
+
+def read_fixtures(publication, kind):
+    """returns the html of every `kind` ('article' or 'search') fixture page of a publication"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, publication, f'{kind}_*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    return pages
+
+def repeat(func, items, min_time):
+    """runs `func` on every item until at least `min_time` seconds have passed, returning (items processed, seconds)"""
+    n = 0
+    start = time.perf_counter()
+    while True:
+        for item in items:
+            func(item)
+        n += len(items)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return n, elapsed
+
+
+# stages: each returns (units processed, seconds)
+def fatal_check_stage(min_time):
+    import pandas as pd
+    from extract_sentences import sentence_matches, ensure_nltk_data
+    ensure_nltk_data()
+    sentences = pd.concat([pd.read_csv(path, index_col=0)['sentence'] for path in sentences_paths]).tolist()
+    sentence_matches(sentences[:10]) # load the tagger outside the timing
+    n, elapsed = repeat(sentence_matches, [sentences], min_time)
+    return n * len(sentences), elapsed
+
+def extract_stage(publication):
+    def run(min_time):
+        from article_stage import Page
+        import extractors
+        stage = getattr(extractors, f'{publication}_stage')
+        url = f'https://example.com/{publication}/article'
+
+        def extract(html):
+            page = Page(url, html)
+            for extractor in stage.extractors.values():
+                extractor(page)
+
+        return repeat(extract, read_fixtures(publication, 'article'), min_time)
+    return run
+
+def search_stage(publication):
+    def run(min_time):
+        from article_stage import Page
+        from parsing import parse
+        return repeat(lambda html: parse(f'{publication}_cards', Page('https://example.com/search', html)),
+                      read_fixtures(publication, 'search'), min_time)
+    return run
+
+STAGES = {'fatal_check': (fatal_check_stage, 'sentences/s'),
+          'globe_articles': (extract_stage('globe'), 'pages/s'),
+          'star_articles': (extract_stage('star'), 'pages/s'),
+          'post_articles': (extract_stage('post'), 'pages/s'),
+          'star_search': (search_stage('star'), 'pages/s'),
+          'post_search': (search_stage('post'), 'pages/s'),
+          'globe_search': (search_stage('globe'), 'pages/s')}
+
+def run_stage(name, min_time):
+    """runs one stage (in a worker process) and returns its throughput and the process's peak RSS in MB"""
+    # ru_maxrss is inherited from the parent, so the process's own high-water mark is used
+    from benchmark_parsing import peak_rss
+    n, elapsed = STAGES[name][0](min_time)
+    return n / elapsed, peak_rss() / 1024
+
+def run_suite(names, min_time=MIN_TIME):
+    """runs every stage in its own fresh process, so peak memory is measured per stage"""
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            rate, peak_rss = executor.submit(run_stage, name, min_time).result()
+        results[name] = {'rate': rate, 'unit': STAGES[name][1], 'peak_rss_mb': peak_rss}
+        print(f"{name:<15} {rate:>10.1f} {STAGES[name][1]:<12} {peak_rss:>7.1f} MB peak RSS")
+    return results
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """prints the change from the baseline for each stage and returns the stages that regressed"""
+    regressions = []
+    print(f"\n{'stage':<15} {'throughput':>10} {'peak RSS':>9}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'{name:<15} {"(no baseline)":>10}')
+            continue
+        rate_change = result['rate'] / baseline[name]['rate'] - 1
+        rss_change = result['peak_rss_mb'] / baseline[name]['peak_rss_mb'] - 1
+        regressed = rate_change < -threshold or rss_change > threshold
+        print(f"{name:<15} {rate_change:>+10.1%} {rss_change:>+9.1%}{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def record_fixtures(n):
+    """copies the cached pages of the first `n` articles of each article list into the fixtures"""
+    import pandas as pd
+    import cache
+    for publication, path in article_list_paths.items():
+        os.makedirs(os.path.join(fixtures_dir, publication), exist_ok=True)
+        recorded = 0
+        for url in pd.read_csv(path)['url']:
+            html = cache.cache.get(url)
+            if html is None:
+                continue
+            with open(os.path.join(fixtures_dir, publication, f'article_recorded_{recorded}.html'), 'w', encoding='utf-8') as f:
+                f.write(html)
+            recorded += 1
+            if recorded >= n:
+                break
+        print(f'{publication}: recorded {recorded} article pages from the page cache')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark each stage of the extraction pipeline offline against a stored baseline.')
+    parser.add_argument('stages', nargs='*', default=list(STAGES), help=f"stages to run (default: all of {', '.join(STAGES)})")
+    parser.add_argument('--min-time', type=float, default=MIN_TIME, help='seconds to repeat each stage for')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='allowed fractional regression before failing')
+    parser.add_argument('--save-baseline', action='store_true', help=f'store these results as the baseline in {baseline_path}')
+    parser.add_argument('--record', type=int, metavar='N', help='first copy N cached article pages per publication into the fixtures')
+    args = parser.parse_args()
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    if args.record:
+        record_fixtures(args.record)
+
+    results = run_suite(args.stages, args.min_time)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(baseline_path, 'w') as f:
+            json.dump(baseline, f, indent=1)
+        print(f'\nSaved baseline to {baseline_path}')
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} stages regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        print(f'\nNo baseline at {baseline_path}; run with --save-baseline to record one')
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Shared on-disk cache of downloaded pages for all scrapers, keyed by url.
+Bodies are gzip-compressed and the cache is kept under a size limit by evicting the least recently used pages.
+With `--offline` the cache is replayed without touching the network, so the pipeline can be rerun from a cache snapshot.
+"""
+
+import os
+import gzip
+import hashlib
+import threading
+from client import client
+from metrics import metrics
+from files import atomic_write
+
+CACHE_DIR = '../cache/html'
+MAX_BYTES = 2 * 1024**3 # 2 GB of compressed html
+
+
+def last_used(path):
+    """returns the mtime of a cached page, or 0 if it is already gone (e.g. evicted by another process)"""
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0
+
+
+class OfflineCacheMiss(Exception):
+    """raised when a page is requested in offline mode but is not in the cache"""
+
+
+class HTMLCache:
+    """on-disk cache of page text keyed by the sha256 of the url, evicting least recently used pages past `max_bytes`"""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, offline=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # index existing entries so eviction doesn't need to rescan the directory
+        self._sizes = {}
+        self._total_bytes = 0
+        if os.path.isdir(cache_dir):
+            for subdir in os.listdir(cache_dir):
+                for name in os.listdir(os.path.join(cache_dir, subdir)):
+                    if not name.endswith('.html.gz'):
+                        continue
+                    path = os.path.join(cache_dir, subdir, name)
+                    self._sizes[path] = os.path.getsize(path)
+                    self._total_bytes += self._sizes[path]
+
+    def _path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + '.html.gz')
+
+    def get(self, url):
+        """returns cached text for `url`, or None if it isn't cached"""
+        path = self._path(url)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+
+        # mark as recently used for eviction; if another thread or process evicted it meanwhile, count it as a miss
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return text
+
+    def put(self, url, text):
+        """compresses and stores `text` for `url`, then evicts old pages if the cache is over its size limit"""
+        path = self._path(url)
+        with atomic_write(path) as tmp_path, gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            f.write(text)
+
+        with self._lock:
+            self._total_bytes += os.path.getsize(path) - self._sizes.get(path, 0)
+            self._sizes[path] = os.path.getsize(path)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """deletes least recently used pages until the cache is under 90% of `max_bytes` (caller holds the lock)"""
+        by_last_use = sorted(self._sizes, key=last_used)
+        for path in by_last_use:
+            if self._total_bytes <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= self._sizes.pop(path)
+
+    def get_html(self, url, raise_for_status=False, refresh=False):
+        """
+        Returns page text for `url` from the cache, downloading it with the shared client on a miss.
+        With `refresh` the page is always downloaded (and re-cached) unless the cache is offline, e.g. for search results that change.
+        """
+        text = self.get(url) if self.offline or not refresh else None
+        if text is not None:
+            with self._lock:
+                self.hits += 1
+            metrics.count('cache.hits')
+            return text
+
+        with self._lock:
+            self.misses += 1
+        metrics.count('cache.misses')
+        if self.offline:
+            raise OfflineCacheMiss(url)
+
+        response = client.get(url)
+        # only keep successful responses so a blocked request gets retried next run
+        if response.ok:
+            self.put(url, response.text)
+        elif raise_for_status:
+            response.raise_for_status()
+
+        return response.text
+
+
+class NoCache(HTMLCache):
+    """drop-in replacement for HTMLCache that always downloads"""
+
+    def __init__(self):
+        self.offline = False
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        return None
+
+    def put(self, url, text):
+        pass
+
+
+# shared cache used by get_html, set up by each script with configure()
+cache = NoCache()
+
+def configure(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, offline=False, enabled=True):
+    """sets up the shared cache used by get_html"""
+    global cache
+    cache = HTMLCache(cache_dir, max_bytes, offline) if enabled else NoCache()
+    return cache
+
+def get_html(url, raise_for_status=False, refresh=False):
+    """returns page text for `url` through the shared cache"""
+    return cache.get_html(url, raise_for_status, refresh)
+
+def add_cache_args(parser):
+    """adds the shared cache options to an argparse parser"""
+    parser.add_argument('--offline', action='store_true', help='replay pages from the cache and never touch the network')
+    parser.add_argument('--no-cache', action='store_true', help='always download pages and do not store them')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help=f'cache directory (default: {CACHE_DIR})')
+    parser.add_argument('--cache-max-mb', type=int, default=MAX_BYTES // 1024**2, help='cache size limit in MB before old pages are evicted')
+
+def configure_from_args(args):
+    """sets up the shared cache from options added by add_cache_args"""
+    if args.offline and args.no_cache:
+        raise ValueError('--offline needs the cache, so it cannot be combined with --no-cache')
+
+    return configure(args.cache_dir, args.cache_max_mb * 1024**2, args.offline, enabled=not args.no_cache)
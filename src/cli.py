@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Single entry point for the pipeline (run from src/, like the scripts themselves):
+
+    python cli.py scrape star|post|globe [options]
+    python cli.py extract [options]
+    python cli.py analyze [options]
+
+Each command runs the matching script with the remaining options, importing only that script, so `--help` and
+`analyze` start without loading the scraping and NLP stack. `python cli.py COMMAND --help` shows a command's options.
+"""
+
+import sys
+import runpy
+import argparse
+
+SCRAPERS = {'star': 'scrape_star_articles', 'post': 'scrape_post_articles', 'globe': 'scrape_globe_articles'}
+COMMANDS = {'extract': 'extract_sentences',
+            'analyze': 'analysis',
+            'figures': 'figures',
+            'dedup': 'dedup',
+            'prelabel': 'prelabel',
+            'corpus': 'corpus',
+            'store': 'storage',
+            'benchmark': 'benchmark_pipeline'}
+
+
+def run(module, args):
+    """runs `module` as if it were started as a script with `args`"""
+    # alter_sys makes the script __main__, so its process pools can pickle its functions as usual
+    sys.argv = [f'{module}.py', *args]
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a stage of the pipeline.',
+                                     epilog=f"scrape takes a publication ({'|'.join(SCRAPERS)}); "
+                                            f"every command passes the rest of its options to its script")
+    parser.add_argument('command', choices=['scrape', *COMMANDS])
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='options for the command (see COMMAND --help)')
+    args = parser.parse_args()
+
+    if args.command == 'scrape':
+        if not args.args or args.args[0] not in SCRAPERS:
+            parser.error(f"scrape needs a publication: {', '.join(SCRAPERS)}")
+        run(SCRAPERS[args.args[0]], args.args[1:])
+    else:
+        run(COMMANDS[args.command], args.args)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Shared HTTP client for all scrapers: one pooled session that keeps connections alive per host, sets per-site headers,
+retries 429/5xx responses with exponential backoff, and keeps request statistics for each host.
+"""
+
+import time
+import threading
+from contextlib import nullcontext
+from collections import Counter
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import metrics, percentile, histogram, failure_reason
+
+# the post needs user-agent for requests
+user_agent_header = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36",
+    "Accept-Encoding": "gzip, deflate",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
+    "Accept-Language": "en"
+    }
+
+# extra headers sent to each site (matched on the end of the hostname)
+HOST_HEADERS = {'nationalpost.com': user_agent_header}
+
+TIMEOUT = (10, 30) # seconds to connect, seconds to read
+RETRIES = 5
+BACKOFF = 1.0 # waits 1s, 2s, 4s, ... between retries (or the server's Retry-After)
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+POOL_CONNECTIONS = 8 # hosts to keep pools for
+POOL_MAXSIZE = 16 # open connections kept per host
+
+
+class HostStats:
+    """request counts, status codes, bytes, retries and time spent for one host"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.latencies = []
+        self.statuses = Counter()
+
+
+class Client:
+    """pooled keep-alive session with per-host headers, timeouts, retries with exponential backoff on 429/5xx, and per-host stats"""
+
+    def __init__(self, host_headers=HOST_HEADERS, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF,
+                 pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+        self.host_headers = host_headers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {}
+        self._lock = threading.Lock()
+        # per-host limit and politeness delay (a fetch.HostThrottle), set by fetch_as_completed while it runs
+        self.throttle = None
+
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=['GET', 'HEAD'], respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def max_seconds(self):
+        """returns an upper bound on how long a get can take: every attempt timing out, plus the backoff between them (not counting a longer Retry-After)"""
+        connect, read = self.timeout
+        return (self.retries + 1) * (connect + read) + sum(self.backoff * 2 ** k for k in range(self.retries))
+
+    def _headers(self, host):
+        for suffix, headers in self.host_headers.items():
+            if host == suffix or host.endswith('.' + suffix):
+                return headers
+        return None
+
+    def get(self, url, **kwargs):
+        """same as requests.get, through the shared pool"""
+        parsed = urlparse(url)
+        host = parsed.netloc
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('headers', self._headers(parsed.hostname or ''))
+
+        with self.throttle.slot(url) if self.throttle is not None else nullcontext():
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+            except requests.RequestException as e:
+                self._record(url, host, time.perf_counter() - start, error=e)
+                raise
+
+        self._record(url, host, time.perf_counter() - start, response)
+        return response
+
+    def _record(self, url, host, seconds, response=None, error=None):
+        with self._lock:
+            stats = self.stats.setdefault(host, HostStats())
+            stats.requests += 1
+            stats.seconds += seconds
+            stats.latencies.append(seconds)
+            if response is None:
+                stats.errors += 1
+            else:
+                stats.statuses[response.status_code] += 1
+                stats.bytes += len(response.content)
+                retries = getattr(response.raw, 'retries', None)
+                n_retries = len(retries.history) if retries is not None else 0
+                stats.retries += n_retries
+
+        if response is None:
+            metrics.record('http', seconds, host=host, url=url, error=failure_reason(error))
+        else:
+            metrics.record('http', seconds, host=host, url=url, status=response.status_code, bytes=len(response.content), retries=n_retries)
+
+    def print_stats(self):
+        """prints a summary table of requests per host, and emits each host's latency histogram as a metrics line"""
+        print(f"{'host':<28} {'requests':>8} {'retries':>7} {'errors':>6} {'MB':>8} {'avg s':>6} {'p50 s':>6} {'p90 s':>6}  statuses")
+        for host, stats in sorted(self.stats.items()):
+            statuses = ', '.join(f'{code}: {n}' for code, n in sorted(stats.statuses.items()))
+            print(f'{host:<28} {stats.requests:>8} {stats.retries:>7} {stats.errors:>6} {stats.bytes / 1024**2:>8.1f} '
+                  f'{stats.seconds / max(stats.requests, 1):>6.2f} {percentile(stats.latencies, 0.5):>6.2f} '
+                  f'{percentile(stats.latencies, 0.9):>6.2f}  {statuses}')
+            metrics.emit('host', host=host, requests=stats.requests, retries=stats.retries, errors=stats.errors,
+                         bytes=stats.bytes, statuses=dict(stats.statuses), latency_histogram=histogram(stats.latencies))
+
+    def close(self):
+        self.session.close()
+
+
+# shared client used by every scraper
+client = Client()
+
+def get(url, **kwargs):
+    """same as requests.get, through the shared client"""
+    return client.get(url, **kwargs)
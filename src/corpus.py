@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Pre-tagged corpus store, so lexicon changes can be re-run without refetching or retagging articles.
+`build` fetches every article in the article lists (through the page cache), splits and tags it once, and saves to a
+SQLite file: the article text, each sentence's character span, and its (token, POS, lemma) triples as arrays of
+vocabulary ids. An inverted index maps (lemma, POS class) to the ids of the sentences containing it, so a lexicon query
+(including the fatal sentence check) is a few index lookups over the whole corpus.
+
+    python corpus.py build                             # tag every article not yet in the store
+    python corpus.py query --verbs kill --nouns death  # count matching sentences
+    python corpus.py extract                           # rewrite the *_sentences_raw.csv files from the store, with LEXICONS
+"""
+
+import os
+import time
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import nltk
+from client import client
+from fetch import fetch_as_completed
+from cache import add_cache_args, configure_from_args
+from extractors import get_globe_text, get_star_text, get_post_text
+from sentence_writer import COLUMNS
+import extract_sentences
+from extract_sentences import (ALL_FATAL_VERBS, FATAL_NOUNS, LEXICONS, FATAL_LEXICONS, POS_CLASSES, lemmatize, get_tagger,
+                                load_nlp_models, compile_lexicons, match_lemmas, format_matches, ensure_nltk_data)
+
+corpus_path = '../cache/corpus.sqlite'
+publications = {'globe': (extract_sentences.globe_articles_path, extract_sentences.globe_sentences_path, get_globe_text),
+                'star': (extract_sentences.star_articles_path, extract_sentences.star_sentences_path, get_star_text),
+                'post': (extract_sentences.post_articles_path, extract_sentences.post_sentences_path, get_post_text)}
+
+# POS classes indexed: verbs and nouns are lemmatized as in the fatal check, other tokens are kept as written
+OTHER = 'x'
+ID_DTYPE = np.uint32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (article_id INTEGER PRIMARY KEY, publication TEXT, url TEXT UNIQUE, text TEXT);
+CREATE TABLE IF NOT EXISTS sentences (sentence_id INTEGER PRIMARY KEY, article_id INTEGER, start INTEGER, end INTEGER,
+                                      words BLOB, tags BLOB, lemmas BLOB);
+CREATE INDEX IF NOT EXISTS sentences_article ON sentences (article_id);
+CREATE TABLE IF NOT EXISTS vocab (id INTEGER PRIMARY KEY, string TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS postings (lemma_id INTEGER, pos TEXT, sentence_ids BLOB, PRIMARY KEY (lemma_id, pos));
+"""
+
+
+def pos_class(tag):
+    return POS_CLASSES.get(tag, OTHER)
+
+def tag_article(text):
+    """
+    Splits article text into sentences and returns (start, end, words, tags, lemmas) for each, with character offsets
+    into `text`. Lemmas are computed the same way as in is_fatal, so index lookups give the same matches.
+    """
+    sentences = nltk.sent_tokenize(text)
+    words = [nltk.word_tokenize(sentence) for sentence in sentences]
+    tagged_sents = get_tagger().tag_sents(words)
+
+    tagged_article = []
+    end = 0
+    for sentence, tagged in zip(sentences, tagged_sents):
+        # punkt sentences are slices of the text, so each one is found right after the last; one that isn't (e.g. the
+        # tokenizer normalized it) has no span to store, so it is left out rather than given a bogus offset
+        start = text.find(sentence, end)
+        if start < 0:
+            continue
+        end = start + len(sentence)
+        tags = [tag for _, tag in tagged]
+        lemmas = [word if pos_class(tag) == OTHER else lemmatize(word, pos_class(tag)) for word, tag in tagged]
+        tagged_article.append((start, end, [word for word, _ in tagged], tags, lemmas))
+    return tagged_article
+
+def tag_articles(texts):
+    return [tag_article(text) for text in texts]
+
+
+class Corpus:
+    """the SQLite corpus store, with vocabulary ids cached in memory"""
+
+    def __init__(self, path=corpus_path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.vocab = dict(self.db.execute('SELECT string, id FROM vocab'))
+        self.new_vocab = {} # ids added in the open transaction, cached in `vocab` only once it commits
+
+    def close(self):
+        self.db.close()
+
+    def urls(self):
+        return {url for url, in self.db.execute('SELECT url FROM articles')}
+
+    @contextmanager
+    def transaction(self):
+        """commits the statements run in the block, or rolls them back if it raises; new vocabulary ids are cached only once committed"""
+        try:
+            with self.db:
+                yield
+            self.vocab.update(self.new_vocab)
+        finally:
+            self.new_vocab.clear()
+
+    def ids(self, strings):
+        """returns an array of vocabulary ids for `strings`, adding new ones"""
+        new = [string for string in dict.fromkeys(strings) if string not in self.vocab and string not in self.new_vocab]
+        if new:
+            start = len(self.vocab) + len(self.new_vocab)
+            self.new_vocab.update((string, start + i) for i, string in enumerate(new))
+            self.db.executemany('INSERT INTO vocab VALUES (?, ?)', ((start + i, string) for i, string in enumerate(new)))
+        return np.array([self.vocab[string] if string in self.vocab else self.new_vocab[string] for string in strings], dtype=ID_DTYPE)
+
+    def add_article(self, publication, url, text, tagged_article):
+        """stores an article's text and tagged sentences (inside the caller's transaction())"""
+        article_id = self.db.execute('INSERT INTO articles (publication, url, text) VALUES (?, ?, ?)', (publication, url, text)).lastrowid
+        self.db.executemany('INSERT INTO sentences (article_id, start, end, words, tags, lemmas) VALUES (?, ?, ?, ?, ?, ?)',
+                            [(article_id, start, end, self.ids(words).tobytes(), self.ids(tags).tobytes(), self.ids(lemmas).tobytes())
+                             for start, end, words, tags, lemmas in tagged_article])
+
+    def build_index(self):
+        """rebuilds the (lemma, POS class) -> sentence ids postings from every stored sentence"""
+        strings = {i: string for string, i in self.vocab.items()}
+        classes = {}
+        postings = {}
+        for sentence_id, tags, lemmas in self.db.execute('SELECT sentence_id, tags, lemmas FROM sentences ORDER BY sentence_id'):
+            for tag_id, lemma_id in set(zip(np.frombuffer(tags, ID_DTYPE).tolist(), np.frombuffer(lemmas, ID_DTYPE).tolist())):
+                if tag_id not in classes:
+                    classes[tag_id] = pos_class(strings[tag_id])
+                postings.setdefault((lemma_id, classes[tag_id]), []).append(sentence_id)
+
+        with self.db:
+            self.db.execute('DELETE FROM postings')
+            self.db.executemany('INSERT INTO postings VALUES (?, ?, ?)',
+                                ((lemma_id, pos, np.array(sorted(set(ids)), dtype=ID_DTYPE).tobytes())
+                                 for (lemma_id, pos), ids in postings.items()))
+        return len(postings)
+
+    def lookup(self, lemmas, pos):
+        """returns the sorted ids of sentences containing any of `lemmas` tagged with POS class `pos` ('v', 'n' or 'x')"""
+        lemma_ids = [self.vocab[lemma] for lemma in lemmas if lemma in self.vocab]
+        if not lemma_ids:
+            return np.array([], dtype=ID_DTYPE)
+        rows = self.db.execute(f"SELECT sentence_ids FROM postings WHERE pos = ? AND lemma_id IN ({','.join('?' * len(lemma_ids))})",
+                               [pos, *lemma_ids]).fetchall()
+        return np.unique(np.concatenate([np.frombuffer(ids, ID_DTYPE) for ids, in rows] or [np.array([], dtype=ID_DTYPE)]))
+
+    def query(self, verbs=(), nouns=(), other=()):
+        """returns the ids of sentences with a verb lemma in `verbs`, a noun lemma in `nouns` or another token in `other`"""
+        return np.union1d(np.union1d(self.lookup(verbs, 'v'), self.lookup(nouns, 'n')), self.lookup(other, OTHER))
+
+    def fatal_sentence_ids(self, fatal_verbs=ALL_FATAL_VERBS, fatal_nouns=FATAL_NOUNS):
+        """the fatal sentence check over the whole corpus"""
+        return self.query(fatal_verbs, fatal_nouns)
+
+    def matches(self, sentence_ids, lexicons=LEXICONS):
+        """returns the (category, lemma, token offset) lexicon matches of each of `sentence_ids` from their stored tags and lemmas"""
+        lemma_map = compile_lexicons(lexicons)
+        strings = {i: string for string, i in self.vocab.items()}
+        matches = []
+        for sentence_id in sentence_ids:
+            tags, lemmas = self.db.execute('SELECT tags, lemmas FROM sentences WHERE sentence_id = ?', (int(sentence_id),)).fetchone()
+            pos_lemmas = [(POS_CLASSES.get(strings[tag_id]), strings[lemma_id])
+                          for tag_id, lemma_id in zip(np.frombuffer(tags, ID_DTYPE).tolist(), np.frombuffer(lemmas, ID_DTYPE).tolist())]
+            matches.append(match_lemmas(pos_lemmas, lemma_map))
+        return matches
+
+    def sentences(self, sentence_ids):
+        """returns a dataframe of (sentence_id, publication, url, sentence) for `sentence_ids`, in corpus order"""
+        self.db.execute('CREATE TEMP TABLE IF NOT EXISTS selected (sentence_id INTEGER PRIMARY KEY)')
+        self.db.execute('DELETE FROM selected')
+        self.db.executemany('INSERT INTO selected VALUES (?)', ((int(i),) for i in sentence_ids))
+        rows = self.db.execute('SELECT s.sentence_id, a.publication, a.url, substr(a.text, s.start + 1, s.end - s.start) '
+                               'FROM selected JOIN sentences s USING (sentence_id) JOIN articles a USING (article_id) '
+                               'ORDER BY s.sentence_id').fetchall()
+        return pd.DataFrame(rows, columns=['sentence_id', 'publication', 'url', 'sentence'])
+
+
+def store_finished(batches, corpus, jobs, wait=False, max_batches=None):
+    """
+    Adds the articles of finished tagging batches to the store and returns (batches still running, articles added).
+    With `max_batches`, waits on the oldest batches until no more than that many are left.
+    """
+    n_oldest = 0 if max_batches is None else len(batches) - max_batches
+    running = []
+    added = 0
+    for k, (chunk, future) in enumerate(batches):
+        if wait or k < n_oldest or future.done():
+            with corpus.transaction():
+                for (j, text), tagged_article in zip(chunk, future.result()):
+                    corpus.add_article(jobs[j][0], jobs[j][2], text, tagged_article)
+                    added += 1
+        else:
+            running.append((chunk, future))
+    return running, added
+
+def build(corpus, workers=extract_sentences.nlp_workers, chunksize=extract_sentences.nlp_chunksize):
+    """fetches and tags every listed article not yet in the store, then rebuilds the index"""
+    # an article listed by more than one publication is stored once, under the first
+    stored = corpus.urls()
+    jobs = []
+    for publication, (articles_path, _, get_text) in publications.items():
+        for url in pd.read_csv(articles_path)['url']:
+            if url not in stored:
+                stored.add(url)
+                jobs.append((publication, get_text, url))
+
+    added = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=extract_sentences.nlp_context, initializer=load_nlp_models) as executor:
+        batches = []
+        chunk = []
+        description = f'Tagging {len(jobs)} articles...'
+        fetches = fetch_as_completed([(get_text, url) for _, get_text, url in jobs], max_workers=extract_sentences.max_workers,
+                                     per_host_limit=extract_sentences.per_host_limit, delay=extract_sentences.host_delay, desc=description)
+        for j, text, error in fetches:
+            if error is not None:
+                print(f'Could not find {jobs[j][2]}. Article may have moved. ({error})')
+                continue
+            chunk.append((j, text))
+            if len(chunk) >= chunksize:
+                batches.append((chunk, executor.submit(tag_articles, [text for _, text in chunk])))
+                chunk = []
+            # store tagged batches as they finish, and wait on the oldest once too many are pending, so the texts held
+            # are bounded by the fetch window and the batches in flight
+            batches, n = store_finished(batches, corpus, jobs, max_batches=extract_sentences.nlp_max_batches)
+            added += n
+
+        if chunk:
+            batches.append((chunk, executor.submit(tag_articles, [text for _, text in chunk])))
+        _, n = store_finished(batches, corpus, jobs, wait=True)
+        added += n
+
+    n_keys = corpus.build_index()
+    return added, n_keys
+
+def extract(corpus, lexicons=LEXICONS, required=FATAL_LEXICONS):
+    """returns {publication: dataframe in the *_sentences_raw.csv layout} of the sentences matching a `required` lexicon"""
+    verbs = [lemma for name in required for lemma in lexicons[name].get('v', [])]
+    nouns = [lemma for name in required for lemma in lexicons[name].get('n', [])]
+    found = corpus.sentences(corpus.query(verbs, nouns))
+    labels = [format_matches(matches) for matches in corpus.matches(found['sentence_id'], lexicons)]
+    found = found.join(pd.DataFrame(labels, columns=['categories', 'terms', 'offsets'], index=found.index))
+
+    results = {}
+    for publication, (articles_path, _, _) in publications.items():
+        df = pd.read_csv(articles_path)
+        rows = df[['datetime', 'title', 'tag', 'url']].merge(found[['url', 'sentence', 'categories', 'terms', 'offsets']], on='url', sort=False)
+        rows.columns = COLUMNS
+        results[publication] = rows.drop_duplicates('sentence').reset_index(drop=True)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build and query the pre-tagged corpus store.')
+    parser.add_argument('command', choices=['build', 'index', 'query', 'extract'])
+    parser.add_argument('--corpus', default=corpus_path, help='SQLite store path')
+    parser.add_argument('--verbs', nargs='*', default=None, help='verb lemmas to look up (default: the fatal verbs)')
+    parser.add_argument('--nouns', nargs='*', default=None, help='noun lemmas to look up (default: the fatal nouns)')
+    parser.add_argument('--nlp-workers', type=int, default=extract_sentences.nlp_workers, help='processes for tagging (default: all cores)')
+    parser.add_argument('--output', help='query: write matching sentences to this csv')
+    add_cache_args(parser)
+    args = parser.parse_args()
+    verbs = ALL_FATAL_VERBS if args.verbs is None else args.verbs
+    nouns = FATAL_NOUNS if args.nouns is None else args.nouns
+
+    corpus = Corpus(args.corpus)
+    if args.command == 'build':
+        cache = configure_from_args(args)
+        ensure_nltk_data(args.offline)
+        added, n_keys = build(corpus, args.nlp_workers)
+        print(f'Added {added} articles; index has {n_keys} (lemma, POS) keys')
+        print(f'Page cache: {cache.hits} hits, {cache.misses} misses')
+        client.print_stats()
+
+    elif args.command == 'index':
+        print(f'Index has {corpus.build_index()} (lemma, POS) keys')
+
+    elif args.command == 'query':
+        start = time.perf_counter()
+        sentence_ids = corpus.query(verbs, nouns)
+        elapsed = time.perf_counter() - start
+        found = corpus.sentences(sentence_ids)
+        print(f'{len(sentence_ids)} matching sentences in {elapsed * 1000:.1f} ms')
+        print(found.groupby('publication').size().to_string())
+        if args.output:
+            found.to_csv(args.output, index=False)
+            print(f'Saved to {args.output}')
+
+    elif args.command == 'extract':
+        for publication, df in extract(corpus).items():
+            sentences_path = publications[publication][1]
+            df.to_csv(sentences_path)
+            print(f'{publication}: {len(df)} extracted\nSaved to {sentences_path}')
+
+    corpus.close()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Persistent crawl index for incremental runs of the search scrapers: every url already seen, plus the newest article date
+seen for each search keyword (its high-water mark). Paginating a newest-first search can stop at the first page that
+holds nothing new, and only new rows are appended to the article list.
+"""
+
+import os
+import json
+import pandas as pd
+from files import atomic_write
+
+
+class CrawlIndex:
+    """seen urls and per-keyword high-water-mark dates, stored as json at `path`"""
+
+    def __init__(self, path):
+        self.path = path
+        self.seen_urls = set()
+        self.high_water_marks = {}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                index = json.load(f)
+            self.seen_urls = set(index['seen_urls'])
+            self.high_water_marks = {keyword: pd.Timestamp(date) for keyword, date in index['high_water_marks'].items()}
+
+    def is_new(self, url, date, keyword):
+        """returns True if `url` hasn't been seen and was published after the keyword's high-water mark"""
+        if url in self.seen_urls:
+            return False
+        high_water_mark = self.high_water_marks.get(keyword)
+        return high_water_mark is None or date > high_water_mark
+
+    def page_is_stale(self, urls, dates, keyword):
+        """returns True if a search results page only holds known or older articles, so pagination can stop"""
+        return not any(self.is_new(url, date, keyword) for url, date in zip(urls, dates))
+
+    def update(self, keyword, urls, dates, failed_urls=()):
+        """
+        Records urls as seen and moves the keyword's high-water mark up to the newest date. Urls in `failed_urls` (e.g. an
+        article that couldn't be fetched) are left unseen and the mark is kept below them, so the next run retries them.
+        """
+        failed_urls = set(failed_urls)
+        self.seen_urls.update(url for url in urls if url not in failed_urls)
+        seen_dates = [date for url, date in zip(urls, dates) if url not in failed_urls]
+        failed_dates = [date for url, date in zip(urls, dates) if url in failed_urls]
+
+        if len(seen_dates) > 0:
+            newest = max(seen_dates)
+            self.high_water_marks[keyword] = max(newest, self.high_water_marks.get(keyword, newest))
+        if len(failed_dates) > 0 and keyword in self.high_water_marks:
+            self.high_water_marks[keyword] = min(self.high_water_marks[keyword], min(failed_dates) - pd.Timedelta(microseconds=1))
+
+    def save(self):
+        index = {'seen_urls': sorted(self.seen_urls),
+                 'high_water_marks': {keyword: date.isoformat() for keyword, date in self.high_water_marks.items()}}
+
+        with atomic_write(self.path) as tmp_path, open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=1)
+
+
+def append_new_rows(df, filename, index=False, fill_values=None):
+    """
+    Appends rows of `df` whose url isn't already in the article list csv at `filename`, matching its columns.
+    Columns the csv has but `df` lacks are filled from `fill_values`. Returns the rows that were appended.
+    """
+    if not os.path.exists(filename):
+        df.to_csv(filename, index=index)
+        return df
+
+    existing = pd.read_csv(filename, index_col=0 if index else None)
+    new = df[~df['url'].isin(existing['url'])].drop_duplicates('url')
+    new = new.assign(**{column: value for column, value in (fill_values or {}).items() if column not in new})
+    new = new.reindex(columns=existing.columns)
+
+    # keep the running index going for csvs saved with one
+    new.index = range(len(existing), len(existing) + len(new))
+    new.to_csv(filename, mode='a', header=False, index=index)
+
+    return new
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Near-duplicate sentence detection within and across publications, so wire copy carried by several papers and updated
+versions of an article are only labelled once. Sentences are shingled into word 3-grams, summarized by MinHash signatures
+and bucketed with LSH banding, so only sentences that share a band are compared and the whole corpus is clustered in
+roughly linear time. Candidate pairs are kept if their estimated Jaccard similarity reaches the threshold.
+
+Every row gets a `dup_cluster` id (shared by its near-duplicates), and with --propagate unlabelled rows take the
+victim/responsible labels of their cluster when its labelled members all agree. Only files that aren't hand-labelled
+(e.g. the *_sentences_raw.csv extraction outputs) are filled: rows a person left blank in the published csvs stay blank.
+Every label that would be filled is listed before --write saves anything. With the default (every) csv, --write saves
+copies to data/dedup/ and leaves the published csvs alone; csvs named on the command line are rewritten in place.
+"""
+
+import os
+import re
+import glob
+import zlib
+import argparse
+import numpy as np
+import pandas as pd
+from files import atomic_write
+
+THRESHOLD = 0.8 # estimated jaccard similarity of word shingles
+NUM_PERM = 128
+SHINGLE_SIZE = 3 # words
+SEED = 1 # fixed, so cluster ids are reproducible
+HASH_PRIME = 4294967311 # smallest prime above 2**32, so (a * x + b) fits in 64 bits for 32-bit x, a and b < 2**31
+
+LABEL_COLUMNS = ['victim', 'responsible']
+sentences_paths = sorted(glob.glob('../data/*_sentences.csv') + glob.glob('../data/*_sentences_raw.csv'))
+hand_labelled_paths = sorted(glob.glob('../data/*_sentences.csv'))
+DEDUP_OUT_DIR = '../data/dedup'
+
+
+def shingles(sentence, k=SHINGLE_SIZE):
+    """returns the crc32 hashes of the lowercased word k-grams of a sentence (the whole sentence if it is shorter)"""
+    words = re.findall(r'\w+', sentence.lower())
+    grams = [' '.join(words[i:i + k]) for i in range(max(len(words) - k + 1, 1))]
+    return [zlib.crc32(gram.encode('utf-8')) for gram in grams]
+
+def minhash_signatures(sentences, num_perm=NUM_PERM, k=SHINGLE_SIZE, seed=SEED, chunk_size=50000):
+    """returns a (sentences x num_perm) array of MinHash signatures, hashing every shingle of the corpus at once"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**31, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 2**31, size=num_perm, dtype=np.uint64)
+
+    hashes = [shingles(sentence, k) for sentence in sentences]
+    lengths = np.array([len(h) for h in hashes])
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    flat = np.fromiter((x for h in hashes for x in h), dtype=np.uint64, count=int(lengths.sum()))
+
+    signatures = np.empty((len(sentences), num_perm), dtype=np.uint64)
+    for start in range(0, len(sentences), chunk_size):
+        stop = min(start + chunk_size, len(sentences))
+        lo, hi = offsets[start], offsets[stop - 1] + lengths[stop - 1]
+        permuted = (flat[lo:hi, None] * a + b) % HASH_PRIME
+        signatures[start:stop] = np.minimum.reduceat(permuted, offsets[start:stop] - lo, axis=0)
+    return signatures
+
+def lsh_bands(threshold=THRESHOLD, num_perm=NUM_PERM):
+    """returns (bands, rows) with bands * rows == num_perm whose LSH threshold (1/bands)**(1/rows) is just below `threshold`"""
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [(bands, rows) for bands, rows in options if (1 / bands) ** (1 / rows) <= threshold]
+    return max(below, key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            # the earlier row stays the root, so cluster ids follow corpus order
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def find_near_duplicates(sentences, threshold=THRESHOLD, num_perm=NUM_PERM, k=SHINGLE_SIZE):
+    """returns an array with a cluster id for every sentence; near-duplicate sentences share an id (ids count up from 0)"""
+    signatures = minhash_signatures(sentences, num_perm, k)
+    bands, rows = lsh_bands(threshold, num_perm)
+    clusters = UnionFind(len(sentences))
+
+    for band in range(bands):
+        # sentences whose signatures agree on every row of the band land in the same bucket
+        band_rows = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        _, buckets = np.unique(band_rows.view([('', band_rows.dtype)] * rows), return_inverse=True)
+        buckets = buckets.ravel()
+        order = np.argsort(buckets, kind='stable')
+        starts = np.flatnonzero(np.diff(buckets[order], prepend=-1))
+
+        # compare each member of a bucket with its first member (a shared cluster links the rest through other bands)
+        for start, stop in zip(starts, np.append(starts[1:], len(order))):
+            if stop - start < 2:
+                continue
+            members = order[start:stop]
+            first = members[0]
+            similarity = (signatures[members[1:]] == signatures[first]).mean(axis=1)
+            for member in members[1:][similarity >= threshold]:
+                clusters.union(first, member)
+
+    roots = np.array([clusters.find(i) for i in range(len(sentences))])
+    _, cluster_ids = np.unique(roots, return_inverse=True)
+    return cluster_ids.ravel()
+
+def propagate_labels(df, columns=LABEL_COLUMNS, fillable=None):
+    """
+    Fills unlabelled rows from their `dup_cluster` when every labelled member of the cluster has the same label. Only rows
+    where the boolean mask `fillable` is True are filled (default: every row). Returns the filled dataframe and a
+    dataframe listing each filled label (the row's index, column and label).
+    """
+    df = df.copy()
+    fillable = np.ones(len(df), dtype=bool) if fillable is None else np.asarray(fillable)
+    filled = []
+    for column in columns:
+        if column not in df:
+            df[column] = np.nan
+        labels = df.groupby('dup_cluster')[column].agg(lambda values: values.dropna().unique())
+        agreed = labels[labels.map(len) == 1].map(lambda values: values[0])
+        missing = df[column].isna().to_numpy() & df['dup_cluster'].isin(agreed.index).to_numpy() & fillable
+        df.loc[missing, column] = df.loc[missing, 'dup_cluster'].map(agreed)
+        filled.append(df.loc[missing, [column]].rename(columns={column: 'label'}).assign(column=column))
+    return df, pd.concat(filled)[['column', 'label']]
+
+def dedupe_files(paths, threshold=THRESHOLD, propagate=False, hand_labelled=hand_labelled_paths):
+    """
+    Clusters the sentences of several csvs together and returns {path: dataframe with dup_cluster}, plus the labels
+    filled. Each dataframe keeps only its own csv's columns, plus the label columns if labels were filled into it.
+    Labels are only filled into csvs that aren't in `hand_labelled`.
+    """
+    frames = {path: pd.read_csv(path, index_col=0) for path in paths}
+    columns = {path: [column for column in df.columns if column != 'dup_cluster'] for path, df in frames.items()}
+    combined = pd.concat(frames.values(), keys=frames.keys(), names=['path', None])
+    combined['dup_cluster'] = find_near_duplicates(combined['sentence'].tolist(), threshold)
+
+    filled = pd.DataFrame(columns=['column', 'label'])
+    if propagate:
+        hand_labelled = {os.path.normpath(path) for path in hand_labelled}
+        paths_of_rows = combined.index.get_level_values('path')
+        fillable = np.array([os.path.normpath(path) not in hand_labelled for path in paths_of_rows])
+        combined, filled = propagate_labels(combined, fillable=fillable)
+        for path in paths:
+            if os.path.normpath(path) not in hand_labelled:
+                columns[path] += [column for column in LABEL_COLUMNS if column not in columns[path]]
+
+    return {path: combined.loc[path, columns[path] + ['dup_cluster']] for path in paths}, filled
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Cluster near-duplicate sentences across publications and optionally propagate labels.')
+    parser.add_argument('paths', nargs='*', help='sentence csvs, rewritten in place by --write (default: every data/*_sentences*.csv, written to --out-dir)')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='estimated jaccard similarity for near-duplicates')
+    parser.add_argument('--propagate', action='store_true', help='copy agreed victim/responsible labels to unlabelled members in csvs that are not hand-labelled')
+    parser.add_argument('--hand-labelled', nargs='*', default=hand_labelled_paths, help='csvs never filled by --propagate (default: data/*_sentences.csv)')
+    parser.add_argument('--write', action='store_true', help='save each csv with the dup_cluster column (and propagated labels)')
+    parser.add_argument('--out-dir', default=None, help=f'directory --write saves to (default: {DEDUP_OUT_DIR}, or in place for csvs named explicitly)')
+    args = parser.parse_args()
+    # the published csvs are only rewritten when asked for by name
+    out_dir = args.out_dir or (None if args.paths else DEDUP_OUT_DIR)
+    paths = args.paths or sentences_paths
+
+    frames, filled = dedupe_files(paths, args.threshold, args.propagate, args.hand_labelled)
+
+    combined = pd.concat(frames.values(), keys=frames.keys(), names=['path', None])
+    sizes = combined.groupby('dup_cluster').size()
+    publications = combined.reset_index().groupby('dup_cluster')['path'].nunique()
+    print(f'{len(combined)} sentences in {len(sizes)} clusters: {(sizes > 1).sum()} clusters of near-duplicates '
+          f'covering {sizes[sizes > 1].sum()} sentences, {(publications > 1).sum()} spanning more than one csv')
+
+    # list every label that would be filled, before anything is written
+    if args.propagate:
+        print(f'{len(filled)} labels {"to propagate" if args.write else "would be propagated (pass --write to save them)"}')
+        for (path, row), fills in filled.groupby(level=[0, 1], sort=False):
+            labels = ', '.join(f'{column}={label}' for column, label in zip(fills['column'], fills['label']))
+            print(f"  {path} row {row}: {labels}  | {combined.loc[(path, row), 'sentence'][:80]}")
+
+    if args.write:
+        for path, df in frames.items():
+            out_path = path if out_dir is None else os.path.join(out_dir, os.path.basename(path))
+            with atomic_write(out_path) as tmp_path:
+                df.to_csv(tmp_path)
+            print(f'Saved to {out_path}')
@@ -5,18 +5,22 @@ Tokenizes and lemmatizes every sentence in article lists, and checks for matches
 NOTE: This was run on Dec 14th, 2023
 """
 
+import os
+import re
+import argparse
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 from tqdm import tqdm
-from bs4 import BeautifulSoup
-from newspaper import Article
-import requests
 import nltk
 from nltk.stem import WordNetLemmatizer 
-from scrape_post_articles import user_agent_header
-
-nltk.download('punkt')
-nltk.download('averaged_perceptron_tagger')
-nltk.download('wordnet')
+from client import client
+from fetch import fetch_as_completed
+from cache import add_cache_args, configure_from_args
+from extractors import get_globe_text, get_star_text, get_post_text
+from sentence_writer import SentenceWriter
+from metrics import metrics, add_metrics_args, configure_metrics_from_args, failure_reason
 
 # nltk token tags
 VERBS = ['VB', 'VBD', 'VBG', 'VBN', 'VBP', 'VBZ']
@@ -29,6 +33,23 @@ FATAL_VERBS_ACTIVE_SPECIFIC = ['behead', 'slaughter', 'execute', 'hang']
 ALL_FATAL_VERBS = FATAL_VERBS_PASSIVE + FATAL_VERBS_ACTIVE + FATAL_VERBS_ACTIVE_SPECIFIC
 FATAL_NOUNS = ['death', 'dead', 'deceased', 'fatality', 'murder', 'homicide', 'assassination', 'massacre', 'slaughter', 'corpse']
 
+# named lexicons matched in one pass per sentence: {name: {'v': verb lemmas, 'n': noun lemmas}}
+# sentences are extracted if they match a FATAL_LEXICONS lexicon; the rest only add labels to extracted sentences
+LEXICONS = {'fatal_passive': {'v': FATAL_VERBS_PASSIVE},
+            'fatal_active': {'v': FATAL_VERBS_ACTIVE},
+            'fatal_specific': {'v': FATAL_VERBS_ACTIVE_SPECIFIC},
+            'fatal_nouns': {'n': FATAL_NOUNS},
+            'injury': {'v': ['injure', 'wound', 'maim'], 'n': ['injury', 'wound', 'casualty']},
+            'hostage': {'v': ['abduct', 'kidnap'], 'n': ['hostage', 'captive', 'abduction', 'kidnapping']}}
+FATAL_LEXICONS = ['fatal_passive', 'fatal_active', 'fatal_specific', 'fatal_nouns']
+POS_CLASSES = {**{tag: 'v' for tag in VERBS}, **{tag: 'n' for tag in NOUNS}}
+
+# nltk data used here: name -> path checked with nltk.data.find (NLTK_DATA and the usual local directories are searched)
+NLTK_RESOURCES = {'punkt': 'tokenizers/punkt', 'averaged_perceptron_tagger': 'taggers/averaged_perceptron_tagger', 'wordnet': 'corpora/wordnet'}
+
+LEMMATIZER = WordNetLemmatizer()
+LEMMA_CACHE_SIZE = 2**17
+
 save_csv = True
 globe_articles_path = '../data/globe_article_list.csv'
 star_articles_path = '../data/star_article_list.csv'
@@ -37,156 +58,312 @@ globe_sentences_path = '../data/globe_sentences_raw.csv'
 star_sentences_path = '../data/star_sentences_raw.csv'
 post_sentences_path = '../data/post_sentences_raw.csv'
 
-def get_globe_sentences(url):
-    """takes a globe article url and returns list of sentences"""
-    article = Article(url)
-    article.download()
-    article.parse()
+# concurrent fetch settings (max_workers = 1 and host_delay = 0 reproduces the old serial run)
+max_workers = 16
+per_host_limit = 4
+host_delay = 0.5
+
+# process pool settings for tokenizing and tagging
+nlp_workers = os.cpu_count()
+nlp_chunksize = 8
+nlp_max_batches = 2 * nlp_workers # batches submitted but not yet written; fetching waits on the oldest beyond this
+# workers are spawned rather than forked: the fetch threads may be holding locks (client stats, metrics, logging) at fork time
+nlp_context = multiprocessing.get_context('spawn')
 
-    text = article.text
+def ensure_nltk_data(offline=False, resources=NLTK_RESOURCES):
+    """downloads the nltk resources that aren't found locally (raising LookupError for missing ones when `offline`)"""
+    for name, path in resources.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            if offline:
+                raise LookupError(f"nltk resource '{name}' is not installed; run nltk.download('{name}') or set NLTK_DATA")
+            nltk.download(name, quiet=True)
 
-    # deal with html formatting
-    text = text.replace('.\n\n', '. ')
-    text = text.replace('\n\n', '. ')
-    
-    return nltk.sent_tokenize(text)
+def get_globe_sentences(url):
+    """takes a globe article url and returns list of sentences"""
+    return nltk.sent_tokenize(get_globe_text(url))
 
 def get_star_sentences(url):
     """takes a star article url and returns list of sentences"""
-    html_text = requests.get(url).text
-    soup = BeautifulSoup(html_text, 'lxml')
-    article_body = soup.find('div', attrs={'id': 'article-body'})
-    text = ''
-
-    for div in article_body.find_all('div', {'class': ['subscriber-preview', 'subscriber-only']}):
-        if 'hidden-print' not in div['class']:
-            try:
-                text += ' ' + div.find('p').text
-            except:
-                pass
-    
-    return nltk.sent_tokenize(text)
+    return nltk.sent_tokenize(get_star_text(url))
 
 def get_post_sentences(url):
     """takes a post article url and returns list of sentences"""
-    html_text = se.get(url).text
-    soup = BeautifulSoup(html_text, 'lxml')
-    text = ''
+    return nltk.sent_tokenize(get_post_text(url))
 
-    paragraphs = soup.find_all('p', class_='', attrs='')
-    for paragraph in paragraphs:
-        text += ' ' + paragraph.text
-    
-    return nltk.sent_tokenize(text)
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(word, pos):
+    """memoized (word, pos) -> lemma lookup with the shared wordnet lemmatizer"""
+    return LEMMATIZER.lemmatize(word, pos)
 
-def fatal_sentence_check(sentence, lemmatizer=WordNetLemmatizer(), verbs=VERBS, fatal_verbs=ALL_FATAL_VERBS, nouns=NOUNS, fatal_nouns=FATAL_NOUNS):
-    """"tokenizes sentence into words, tags word position, lemmatizes verbs, and returns True if any verb matches `fatal_verbs` or `fatal_nouns`"""
-    fatal = False
-    words = nltk.word_tokenize(sentence)
-    tagged = nltk.pos_tag(words)
+@lru_cache(maxsize=None)
+def get_tagger():
+    """loads the perceptron pos tagger once per process (nltk.pos_tag reloads it on every call)"""
+    from nltk.tag.perceptron import PerceptronTagger
+    return PerceptronTagger()
+
+def surface_forms(lemmas, pos):
+    """
+    Returns every word that the wordnet lemmatizer maps to one of `lemmas` for `pos` ('v' or 'n'), e.g. kill -> killed, kills, killing.
+    Inverts wordnet's suffix rules and exception lists, then keeps only forms that really lemmatize back to `lemmas`.
+    """
+    from nltk.corpus import wordnet
+
+    lemmas = set(lemmas)
+    candidates = set(lemmas)
+
+    # regular inflections: undo each suffix substitution morphy can apply
+    for lemma in lemmas:
+        for old, new in wordnet.MORPHOLOGICAL_SUBSTITUTIONS[pos]:
+            if lemma.endswith(new):
+                candidates.add(lemma[:len(lemma) - len(new)] + old)
 
-    for tag in tagged:
-        word = tag[0]
-        pos = tag[1]
+    # irregular inflections (shot, hung, ...)
+    for form, bases in wordnet._exception_map[pos].items():
+        if lemmas.intersection(bases):
+            candidates.add(form)
 
+    return {form for form in candidates if LEMMATIZER.lemmatize(form, pos) in lemmas}
+
+@lru_cache(maxsize=None)
+def fatal_prefilter(fatal_verbs, fatal_nouns):
+    """
+    Takes tuples of fatal verb and noun lemmas and returns (regex, surface form set) for rejecting sentences before tagging.
+    A sentence can only match if one of its tokens is a surface form, so sentences the regex doesn't find are never fatal.
+    """
+    forms = surface_forms(fatal_verbs, 'v') | surface_forms(fatal_nouns, 'n')
+    alternatives = '|'.join(sorted(map(re.escape, forms), key=len, reverse=True))
+    pattern = re.compile(rf'\b(?:{alternatives})\b', re.IGNORECASE)
+
+    return pattern, frozenset(forms)
+
+def compile_lexicons(lexicons=LEXICONS):
+    """returns the precomputed (pos class, lemma) -> categories map for a dict of named lexicons"""
+    lemma_map = {}
+    for category, lemmas_by_pos in lexicons.items():
+        for pos, lemmas in lemmas_by_pos.items():
+            for lemma in lemmas:
+                lemma_map.setdefault((pos, lemma), []).append(category)
+    return {key: tuple(categories) for key, categories in lemma_map.items()}
+
+def match_lemmas(pos_lemmas, lemma_map):
+    """takes (pos class, lemma) per token and returns a (category, lemma, token offset) tuple for every lexicon match"""
+    matches = []
+    for offset, key in enumerate(pos_lemmas):
+        for category in lemma_map.get(key, ()):
+            matches.append((category, key[1], offset))
+    return matches
+
+def match_tagged(tagged, lemma_map, lemmatizer=None):
+    """takes a pos-tagged sentence and returns its lexicon matches, lemmatizing each verb and noun once"""
+    lemma_of = lemmatize if lemmatizer is None else lemmatizer.lemmatize
+    pos_lemmas = []
+    for word, tag in tagged:
+        pos = POS_CLASSES.get(tag)
+        pos_lemmas.append((pos, lemma_of(word, pos)) if pos else (None, word))
+    return match_lemmas(pos_lemmas, lemma_map)
+
+def format_matches(matches):
+    """returns the categories, terms and offsets columns for a sentence's matches, each ';'-separated and aligned"""
+    return tuple(';'.join(str(value) for value in column) for column in zip(*matches)) if matches else ('', '', '')
+
+def is_fatal(tagged, lemmatizer=None, verbs=VERBS, fatal_verbs=ALL_FATAL_VERBS, nouns=NOUNS, fatal_nouns=FATAL_NOUNS):
+    """takes a pos-tagged sentence and returns True if any verb lemma matches `fatal_verbs` or any noun lemma matches `fatal_nouns`"""
+    lemma_of = lemmatize if lemmatizer is None else lemmatizer.lemmatize
+
+    for word, pos in tagged:
         if pos in verbs:
-            lemma = lemmatizer.lemmatize(word, 'v')
-            if lemma in fatal_verbs:
-                fatal = True
+            if lemma_of(word, 'v') in fatal_verbs:
+                return True
         elif pos in nouns:
-            lemma = lemmatizer.lemmatize(word, 'n')
-            if lemma in fatal_nouns:
-                fatal = True
+            if lemma_of(word, 'n') in fatal_nouns:
+                return True
+
+    return False
+
+def tag_candidates(sentences, fatal_verbs=ALL_FATAL_VERBS, fatal_nouns=FATAL_NOUNS):
+    """
+    Returns (index, tagged sentence) for every sentence that could be fatal.
+    Sentences without a fatal surface form are rejected before tokenizing, and the rest are tagged together by one loaded tagger.
+    """
+    pattern, forms = fatal_prefilter(tuple(fatal_verbs), tuple(fatal_nouns))
+
+    candidates = []
+    n_searched = 0
+    with metrics.timer('tokenize'):
+        for i, sentence in enumerate(sentences):
+            if pattern.search(sentence):
+                n_searched += 1
+                words = nltk.word_tokenize(sentence)
+                if any(word.lower() in forms for word in words):
+                    candidates.append((i, words))
+
+    metrics.count('prefilter.sentences', len(sentences))
+    metrics.count('prefilter.regex_rejected', len(sentences) - n_searched)
+    metrics.count('prefilter.token_rejected', n_searched - len(candidates))
+
+    with metrics.timer('tag'):
+        tagged_sents = get_tagger().tag_sents([words for _, words in candidates])
+    return [(i, tagged) for (i, _), tagged in zip(candidates, tagged_sents)]
+
+def fatal_sentence_checks(sentences, lemmatizer=None, verbs=VERBS, fatal_verbs=ALL_FATAL_VERBS, nouns=NOUNS, fatal_nouns=FATAL_NOUNS):
+    """batched fatal_sentence_check: returns a list of booleans, one per sentence"""
+    fatal = [False] * len(sentences)
+    candidates = tag_candidates(sentences, fatal_verbs, fatal_nouns)
+    with metrics.timer('lemmatize'):
+        for i, tagged in candidates:
+            fatal[i] = is_fatal(tagged, lemmatizer, verbs, fatal_verbs, nouns, fatal_nouns)
 
     return fatal
 
+def fatal_sentence_check(sentence, lemmatizer=None, verbs=VERBS, fatal_verbs=ALL_FATAL_VERBS, nouns=NOUNS, fatal_nouns=FATAL_NOUNS):
+    """"tokenizes sentence into words, tags word position, lemmatizes verbs, and returns True if any verb matches `fatal_verbs` or `fatal_nouns`"""
+    return fatal_sentence_checks([sentence], lemmatizer, verbs, fatal_verbs, nouns, fatal_nouns)[0]
+
+def sentence_matches(sentences, lexicons=LEXICONS, required=FATAL_LEXICONS):
+    """
+    Matches every lexicon in one pass per sentence. Returns a list with the (category, lemma, token offset) matches of each
+    sentence, or None for sentences that match none of the `required` lexicons (which are prefiltered like fatal_sentence_checks).
+    """
+    lemma_map = compile_lexicons(lexicons)
+    verbs = [lemma for name in required for lemma in lexicons[name].get('v', [])]
+    nouns = [lemma for name in required for lemma in lexicons[name].get('n', [])]
+
+    results = [None] * len(sentences)
+    candidates = tag_candidates(sentences, verbs, nouns)
+    with metrics.timer('lemmatize'):
+        for i, tagged in candidates:
+            matches = match_tagged(tagged, lemma_map)
+            if any(category in required for category, _, _ in matches):
+                results[i] = matches
+
+    return results
+
+def find_fatal_sentences(text):
+    """takes article text and returns (sentence, categories, terms, offsets) for its sentences that mention death, in order"""
+    with metrics.timer('nlp'):
+        with metrics.timer('sent_tokenize'):
+            sentences = nltk.sent_tokenize(text)
+        return [(sentence, *format_matches(matches)) for sentence, matches in zip(sentences, sentence_matches(sentences)) if matches is not None]
+
+def find_fatal_sentences_batch(texts):
+    """takes a list of article texts and returns the fatal sentences of each"""
+    return [find_fatal_sentences(text) for text in texts]
+
+def find_fatal_sentences_batch_timed(texts):
+    """find_fatal_sentences_batch that also returns the worker's metrics for the batch, to merge into the main process"""
+    return find_fatal_sentences_batch(texts), metrics.take()
+
+def load_nlp_models(profile_stage=None, profiler='cprofile'):
+    """loads the sentence tokenizer, tagger, wordnet and prefilter once, so each pool worker pays for them on startup instead of per article"""
+    # workers send their metrics back with each batch instead of writing json lines themselves
+    metrics.reset()
+    metrics.configure(profile_stage=profile_stage, profiler=profiler)
+
+    nltk.sent_tokenize('Warm up.')
+    get_tagger()
+    lemmatize('dogs', 'n')
+    fatal_prefilter(tuple(ALL_FATAL_VERBS), tuple(FATAL_NOUNS))
+    metrics.take()
+
+def find_fatal_sentences_parallel(texts, workers=nlp_workers, chunksize=nlp_chunksize, desc=None):
+    """takes a list of article texts (None for articles that couldn't be fetched) and returns their fatal sentence rows, in order, using a process pool"""
+    results = [[] for _ in texts]
+    jobs = [(i, text) for i, text in enumerate(texts) if text is not None]
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=nlp_context, initializer=load_nlp_models) as executor:
+        fatal_lists = executor.map(find_fatal_sentences, [text for _, text in jobs], chunksize=chunksize)
+        for (i, _), fatal_sentences in zip(jobs, tqdm(fatal_lists, total=len(jobs), desc=desc)):
+            results[i] = fatal_sentences
+
+    return results
+
+def write_finished(nlp_batches, writers, wait=False, max_batches=None):
+    """
+    Passes results of finished nlp batches to their sentence writers and returns the batches still running. With
+    `max_batches`, waits on the oldest batches until no more than that many are left, so texts in flight stay bounded.
+    """
+    n_oldest = 0 if max_batches is None else len(nlp_batches) - max_batches
+    running = []
+    for k, (articles, future) in enumerate(nlp_batches):
+        if wait or k < n_oldest or future.done():
+            fatal_lists, batch_metrics = future.result()
+            metrics.merge(batch_metrics, event='nlp_batch', articles=len(articles))
+            for targets, fatal_sentences in zip(articles, fatal_lists):
+                for p, i in targets:
+                    writers[p].add(i, fatal_sentences)
+        else:
+            running.append((articles, future))
+
+    return running
+
 if __name__ == "__main__":
-    # Globe and Mail
-    df = pd.read_csv(globe_articles_path)
-    date_list, url_list, title_list, sentence_list, tag_list = [], [], [], [], []
-    description = f'Extracting sentences from {len(df)} Globe and Mail articles...'
-    pbar = tqdm(range(len(df)), desc=description)
-    for i in pbar:
-        try:
-            sentences = get_globe_sentences(df.loc[i, 'url'])
-            for sentence in sentences:
-                if fatal_sentence_check(sentence):
-                    date_list.append(df.loc[i, 'datetime'])
-                    url_list.append(df.loc[i, 'url'])
-                    title_list.append(df.loc[i, 'title'])
-                    sentence_list.append(sentence)
-                    tag_list.append(df.loc[i, 'tag'])
-        except:
-            print(f"Could not find {df.loc[i, 'url']}. Article may have moved.")
-
-    description = f'Extracted sentences from {len(df)} Globe and Mail articles.'
-    pbar.set_description(description)
-
-    df_sentences = pd.DataFrame({'date': date_list, 'title': title_list, 'category': tag_list, 'url': url_list, 'sentence': sentence_list})
-    df_sentences = df_sentences.drop_duplicates(('sentence')).reset_index(drop=True)
-    print(f'{len(df_sentences)} extracted')
-
-    if save_csv:
-        df_sentences.to_csv(globe_sentences_path)
-        print(f'Saved to {globe_sentences_path}')
-    
-    # Toronto Star
-    df = pd.read_csv(star_articles_path)
-    date_list, url_list, title_list, sentence_list, tag_list = [], [], [], [], []
-    description = f'Extracting sentences from {len(df)} Toronto Star articles...'
-    pbar = tqdm(range(len(df)), desc=description)
-    for i in pbar:
-        try:
-            sentences = get_star_sentences(df.loc[i, 'url'])
-            for sentence in sentences:
-                if fatal_sentence_check(sentence):
-                    date_list.append(df.loc[i, 'datetime'])
-                    url_list.append(df.loc[i, 'url'])
-                    title_list.append(df.loc[i, 'title'])
-                    sentence_list.append(sentence)
-                    tag_list.append(df.loc[i, 'tag'])
-        except:
-            print(f"Could not find {df.loc[i, 'url']}. Article may have moved.")
-
-    description = f'Extracted sentences from {len(df)} Toronto Star articles.'
-    pbar.set_description(description)
-
-    df_sentences = pd.DataFrame({'date': date_list, 'title': title_list, 'category': tag_list, 'url': url_list, 'sentence': sentence_list})
-    df_sentences = df_sentences.drop_duplicates(('sentence')).reset_index(drop=True)
-    print(f'{len(df_sentences)} extracted')
-
-    if save_csv:
-        df_sentences.to_csv(star_sentences_path)
-        print(f'Saved to {star_sentences_path}')
-
-    # National Post
-    with requests.Session() as se:
-        se.headers = user_agent_header
-
-    df = pd.read_csv(post_articles_path)
-    date_list, url_list, title_list, sentence_list, tag_list = [], [], [], [], []
-    description = f'Extracting sentences from {len(df)} National Post articles...'
-    pbar = tqdm(range(len(df)), desc=description)
-    for i in pbar:
-        try:
-            sentences = get_post_sentences(df.loc[i, 'url'])
-            for sentence in sentences:
-                if fatal_sentence_check(sentence):
-                    date_list.append(df.loc[i, 'datetime'])
-                    url_list.append(df.loc[i, 'url'])
-                    title_list.append(df.loc[i, 'title'])
-                    sentence_list.append(sentence)
-                    tag_list.append(df.loc[i, 'tag'])
-        except:
-            print(f"Could not find {df.loc[i, 'url']}. Article may have moved.")
-
-    description = f'Extracted sentences from {len(df)} National Post articles.'
-    pbar.set_description(description)
-
-    df_sentences = pd.DataFrame({'date': date_list, 'title': title_list, 'category': tag_list, 'url': url_list, 'sentence': sentence_list})
-    df_sentences = df_sentences.drop_duplicates(('sentence')).reset_index(drop=True)
-    print(f'{len(df_sentences)} extracted')
-
-    if save_csv:
-        df_sentences.to_csv(post_sentences_path)
-        print(f'Saved to {post_sentences_path}')
+    parser = argparse.ArgumentParser(description='Extract sentences mentioning death from every article list.')
+    parser.add_argument('--nlp-workers', type=int, default=nlp_workers, help='processes for tokenizing and tagging (default: all cores)')
+    parser.add_argument('--resume', action='store_true', help='skip articles recorded in the checkpoints of a previous run and append to its output')
+    add_cache_args(parser)
+    add_metrics_args(parser)
+    args = parser.parse_args()
+    cache = configure_from_args(args)
+    configure_metrics_from_args(args)
+    ensure_nltk_data(args.offline)
+
+    publications = [('Globe and Mail', globe_articles_path, globe_sentences_path, get_globe_text),
+                    ('Toronto Star', star_articles_path, star_sentences_path, get_star_text),
+                    ('National Post', post_articles_path, post_sentences_path, get_post_text)]
+
+    # sentences are streamed to csv as articles finish, in article list order
+    writers = []
+    for _, articles_path, sentences_path, _ in publications:
+        df = pd.read_csv(articles_path)
+        writers.append(SentenceWriter(df, sentences_path if save_csv else None, resume=args.resume))
+
+    # each unique url is fetched once, even if it appears more than once in an article list
+    articles = {}
+    for p, writer in enumerate(writers):
+        for i in writer.todo():
+            articles.setdefault((p, writer.df.loc[i, 'url']), []).append((p, i))
+    jobs = [(publications[p][3], url) for p, url in articles]
+    targets = list(articles.values())
+    if args.resume:
+        print(f'Resuming: {sum(len(writer.df) - len(writer.todo()) for writer in writers)} articles already done')
+
+    # fetch stage feeds the cpu stage: fetched texts are tokenized, tagged and checked in chunks on every core
+    executor = ProcessPoolExecutor(max_workers=args.nlp_workers, mp_context=nlp_context, initializer=load_nlp_models,
+                                   initargs=(args.profile, args.profiler))
+    try:
+        nlp_batches = []
+        chunk = []
+        description = f'Extracting sentences from {len(jobs)} articles...'
+        for j, text, error in fetch_as_completed(jobs, max_workers=max_workers, per_host_limit=per_host_limit, delay=host_delay, desc=description):
+            if error is not None:
+                print(f"Could not find {jobs[j][1]}. Article may have moved. ({failure_reason(error)}: {error})")
+                for p, i in targets[j]:
+                    writers[p].skip(i)
+                continue
+
+            chunk.append((targets[j], text))
+            if len(chunk) >= nlp_chunksize:
+                nlp_batches.append(([article for article, _ in chunk], executor.submit(find_fatal_sentences_batch_timed, [text for _, text in chunk])))
+                chunk = []
+            nlp_batches = write_finished(nlp_batches, writers, max_batches=nlp_max_batches)
+
+        if chunk:
+            nlp_batches.append(([article for article, _ in chunk], executor.submit(find_fatal_sentences_batch_timed, [text for _, text in chunk])))
+        write_finished(nlp_batches, writers, wait=True)
+    finally:
+        # on Ctrl-C, keep everything finished so far so --resume can pick up from here
+        executor.shutdown(wait=False, cancel_futures=True)
+        for writer in writers:
+            writer.close()
+
+    for (publication_name, _, sentences_path, _), writer in zip(publications, writers):
+        print(f'{publication_name}: {writer.n_rows} extracted')
+        if save_csv:
+            print(f'Saved to {sentences_path}')
+
+    print(f'Page cache: {cache.hits} hits, {cache.misses} misses')
+    client.print_stats()
+    metrics.print_summary()
+    metrics.close()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Extractors for each publication's article pages, and the fused article stage that runs them.
+Every extractor takes a fetched Page and returns one json-serializable value.
+"""
+
+from article_stage import ArticleStage
+from parsing import parse
+
+
+def globe_text(page):
+    """returns the text of a globe article"""
+    # imported here since newspaper is slow to import and only the globe needs it
+    from newspaper import Article
+
+    article = Article(page.url)
+    article.download(input_html=page.html)
+    article.parse()
+
+    text = article.text
+
+    # deal with html formatting
+    text = text.replace('.\n\n', '. ')
+    text = text.replace('\n\n', '. ')
+
+    return text
+
+def star_text(page):
+    """returns the text of a star article"""
+    return parse('star_text', page)
+
+def star_tag(page):
+    """returns the section tag of a star article (the last breadcrumb), which is more reliable than the search result tag"""
+    return parse('star_tag', page)
+
+def star_keywords(page):
+    """returns the metadata keywords of a star article"""
+    return parse('star_keywords', page)
+
+def post_text(page):
+    """returns the text of a post article"""
+    return parse('post_text', page)
+
+
+# error pages (403s from blocking, 404s, 5xx) fail as http_<code> instead of being parsed as articles
+globe_stage = ArticleStage('globe', {'text': globe_text}, raise_for_status=True)
+star_stage = ArticleStage('star', {'tag': star_tag, 'keywords': star_keywords, 'text': star_text}, raise_for_status=True)
+post_stage = ArticleStage('post', {'text': post_text}, raise_for_status=True)
+
+
+class NoArticleText(ValueError):
+    """raised when a fetched page has no article text (e.g. an error page or a changed layout)"""
+
+
+def get_text(stage, url):
+    """returns the article text of `url` from `stage`, raising if the page had no article text"""
+    text = stage.extract(url)['text']
+    if text is None:
+        raise NoArticleText(f'no article text found at {url}')
+    return text
+
+def get_globe_text(url):
+    """takes a globe article url and returns the article text"""
+    return get_text(globe_stage, url)
+
+def get_star_text(url):
+    """takes a star article url and returns the article text"""
+    return get_text(star_stage, url)
+
+def get_post_text(url):
+    """takes a post article url and returns the article text"""
+    return get_text(post_stage, url)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Thread pool scheduler for fetching articles from several publications at once, with a concurrency limit and politeness delay per host.
+The throttle is applied by the shared client around each real HTTP request, so jobs answered from the page cache,
+the extraction memo or an offline replay never wait for it.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import zip_longest, islice
+from urllib.parse import urlparse
+from tqdm import tqdm
+from client import client
+
+# default scheduler settings
+MAX_WORKERS = 16
+PER_HOST_LIMIT = 4
+HOST_DELAY = 0.5 # seconds between request starts on the same host
+WINDOW = 4 # jobs submitted ahead per worker, so results are held only until they're yielded
+
+
+class HostThrottle:
+    """limits the number of in-flight requests per host and spaces out request starts on each host by `delay` seconds"""
+
+    def __init__(self, per_host_limit=PER_HOST_LIMIT, delay=HOST_DELAY):
+        self.per_host_limit = per_host_limit
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._semaphores[host]
+
+    @contextmanager
+    def slot(self, url):
+        """blocks until a request to the host of `url` is allowed, then holds one of its slots"""
+        host = urlparse(url).netloc
+        with self._semaphore(host):
+            # reserve the next start time for this host, then sleep outside the lock
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, now))
+                self._next_start[host] = start + self.delay
+            wait = start - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            yield
+
+
+def interleave_by_host(jobs):
+    """takes a list of (func, url) jobs and returns their indices reordered round-robin across hosts so no host blocks the pool"""
+    by_host = {}
+    for i, (_, url) in enumerate(jobs):
+        by_host.setdefault(urlparse(url).netloc, []).append(i)
+
+    return [i for group in zip_longest(*by_host.values()) for i in group if i is not None]
+
+
+def fetch_as_completed(jobs, max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT, delay=HOST_DELAY, desc=None):
+    """
+    Takes a list of (func, url) jobs and calls func(url) for each on a thread pool, with the shared client's requests throttled per host.
+    Yields (job index, result, exception) tuples as jobs finish, so callers can stream results without holding them all.
+    """
+    def run(i):
+        func, url = jobs[i]
+        try:
+            return i, func(url), None
+        except Exception as e:
+            return i, None, e
+
+    # only requests that reach the network take a host slot and wait for the politeness delay
+    previous, client.throttle = client.throttle, HostThrottle(per_host_limit=per_host_limit, delay=delay)
+    order = iter(interleave_by_host(jobs))
+    pending = set()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor, tqdm(total=len(jobs), desc=desc) as progress:
+            try:
+                # a bounded window of jobs is submitted or waiting to be yielded at a time, and each future is dropped
+                # once it has been yielded, so only the window's results are held
+                window = max_workers * WINDOW
+                pending.update(executor.submit(run, i) for i in islice(order, window))
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        progress.update()
+                        yield future.result()
+                    del done, future
+                    pending.update(executor.submit(run, i) for i in islice(order, window - len(pending)))
+            finally:
+                # stop queued downloads if the caller stops early (e.g. Ctrl-C)
+                for future in pending:
+                    future.cancel()
+    finally:
+        client.throttle = previous
+
+
+def fetch_in_order(jobs, max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT, delay=HOST_DELAY, desc=None):
+    """
+    Takes a list of (func, url) jobs and calls func(url) for each on a thread pool, with requests throttled per host.
+    Returns a list of (result, exception) tuples in the same order as `jobs`, so output is identical to a serial run.
+    """
+    results = [None] * len(jobs)
+    for i, result, error in fetch_as_completed(jobs, max_workers, per_host_limit, delay, desc):
+        results[i] = (result, error)
+
+    return results
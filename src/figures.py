@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Builds the figures in figures/ headlessly: plots are rendered with the Agg backend in a process pool, and a figure is
+only re-rendered when the hash of its data slice and plot parameters differs from the one recorded in the manifest
+(or its png was changed or deleted). Relabelling one publication therefore only rebuilds that publication's two figures.
+`--preview` renders quick low-DPI copies to cache/figures_preview/ instead of the 800-DPI publication figures.
+"""
+
+import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import seaborn as sns
+import pandas as pd
+from tqdm import tqdm
+import analysis
+from files import atomic_write
+
+FIGURE_VERSION = 2 # bump when the plotting code changes, to rebuild every figure
+
+figures_dir = '../figures'
+preview_dir = '../cache/figures_preview'
+manifest_dir = '../cache/figures'
+PUBLICATION_DPI = 800
+PREVIEW_DPI = 100
+
+# palette indices into the default seaborn palette: first group red, second group blue
+PALETTE = [3, 0]
+KINDS = {'deaths': ('death', 'fatalities'), 'blame': ('blame', 'group responsible')}
+# days the OCHA couldn't update the gaza death toll because of the communications blackout
+BLACKOUT = ('2023-11-10', '2023-11-21')
+
+
+def ocha_slice(date_range=analysis.DATE_RANGE, path=analysis.ocha_path):
+    """returns the OCHA death totals reported within `date_range` by date, forward filled"""
+    ocha = pd.read_csv(path, index_col=0, parse_dates=['date'])
+    ocha = analysis.in_range(ocha, date_range).set_index('date')
+    ocha = ocha[['pal_total', 'isr_total']].ffill()
+    return ocha.rename(columns={'pal_total': 'palestinian', 'isr_total': 'israeli'})
+
+def figure_specs(date_range=analysis.DATE_RANGE, publications=analysis.PUBLICATIONS):
+    """returns (filename, plot function name, data, params) for every figure"""
+    specs = [('ocha_deaths.png', 'plot_ocha', ocha_slice(date_range),
+              {'title': f'Total deaths reported by the OCHA ({date_range[0]} to {date_range[1]})'})]
+
+    cube, _ = analysis.load_cube()
+    for publication, publication_name in publications.items():
+        for kind, (file_kind, description) in KINDS.items():
+            title = f'{publication_name}: Published references to {description} ({date_range[0]} to {date_range[1]})'
+            specs.append((f'{publication}_{file_kind}_mentions.png', 'plot_daily_mentions',
+                          analysis.daily_mentions(cube, publication, kind, date_range), {'title': title}))
+    return specs
+
+def spec_hash(plot, data, params, dpi):
+    """returns a hash of everything that determines a figure's pixels"""
+    digest = hashlib.sha256(json.dumps([FIGURE_VERSION, plot, params, dpi], sort_keys=True).encode())
+    digest.update(data.to_csv().encode())
+    return digest.hexdigest()
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def plot_daily_mentions(data, title=None, figsize=(12, 3)):
+    """plots daily mention counts of two groups (one column each)"""
+    palette = [sns.color_palette()[i] for i in PALETTE]
+
+    fig, ax = plt.subplots(figsize=figsize)
+    sns.lineplot(data, ax=ax, palette=palette, dashes=False)
+
+    ax.set_title(title)
+    ax.set_ylabel('# daily mentions')
+    ax.set_xlabel('publication date')
+    ax.set_xticks(data.index[::7])
+    ax.set_xticklabels(data.index[::7].strftime('%b %d'))
+    fig.autofmt_xdate(rotation=45)
+
+    return fig
+
+def plot_ocha(data, title=None, figsize=(12, 3)):
+    """plots the OCHA death totals, with the gaza communications blackout marked"""
+    palette = [sns.color_palette()[i] for i in PALETTE]
+
+    fig, ax = plt.subplots(figsize=figsize)
+    sns.lineplot(data, ax=ax, palette=palette, dashes=False)
+
+    ax.set_title(title)
+    ax.set_ylabel('# deaths')
+    ax.set_xlabel('report date')
+    ax.set_xticks(data.index[::7])
+    ax.set_xticklabels(data.index[::7].strftime('%b %d'))
+    fig.autofmt_xdate(rotation=45)
+
+    # mark the part of the blackout within the plotted dates, at the top of the plot
+    start, end = max(pd.Timestamp(BLACKOUT[0]), data.index[0]), min(pd.Timestamp(BLACKOUT[1]), data.index[-1])
+    if start <= end:
+        top = 1.03 * data.max().max()
+        ax.hlines(top, start, end, linestyles='--', colors='g', linewidth=2)
+        ax.text(start, 0.85 * top, 'gaza comms blackout')
+
+    return fig
+
+PLOTS = {'plot_daily_mentions': plot_daily_mentions, 'plot_ocha': plot_ocha}
+
+def render(path, plot, data, params, dpi):
+    """renders one figure to `path` (runs in a worker process)"""
+    sns.set()
+    fig = PLOTS[plot](data, **params)
+
+    with atomic_write(path, suffix='.tmp.png') as tmp_path:
+        fig.savefig(tmp_path, dpi=dpi)
+    plt.close(fig)
+
+    return file_hash(path)
+
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def save_manifest(manifest, path):
+    with atomic_write(path) as tmp_path, open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+def build_figures(out_dir=figures_dir, dpi=PUBLICATION_DPI, date_range=analysis.DATE_RANGE, workers=None, force=False, only=None):
+    """renders every figure whose inputs changed since the last build into `out_dir`, returning the rebuilt filenames"""
+    os.makedirs(out_dir, exist_ok=True)
+    os.makedirs(manifest_dir, exist_ok=True)
+    manifest_path = os.path.join(manifest_dir, f'manifest-{dpi}dpi.json')
+    manifest = load_manifest(manifest_path)
+
+    jobs = []
+    for filename, plot, data, params in figure_specs(date_range):
+        if only and filename not in only:
+            continue
+        path = os.path.join(out_dir, filename)
+        key = spec_hash(plot, data, params, dpi)
+        entry = manifest.get(path)
+        if not force and entry is not None and entry['key'] == key and os.path.exists(path) and file_hash(path) == entry['png']:
+            continue
+        jobs.append((path, key, (path, plot, data, params, dpi)))
+
+    rebuilt = []
+    failed = {}
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(render, *job_args): (path, key) for path, key, job_args in jobs}
+            for future in tqdm(as_completed(futures), total=len(futures), desc=f'Rendering {len(futures)} figures...'):
+                path, key = futures[future]
+                try:
+                    manifest[path] = {'key': key, 'png': future.result()}
+                    rebuilt.append(os.path.basename(path))
+                except Exception as e:
+                    failed[os.path.basename(path)] = e
+        # the figures that did render are recorded even if others failed
+        save_manifest(manifest, manifest_path)
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} figures failed to render: " +
+                           '; '.join(f'{filename} ({type(e).__name__}: {e})' for filename, e in sorted(failed.items()))) from next(iter(failed.values()))
+    return rebuilt
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render the figures that are out of date.')
+    parser.add_argument('--preview', action='store_true', help=f'render {PREVIEW_DPI}-DPI previews to {preview_dir} instead')
+    parser.add_argument('--force', action='store_true', help='render every figure, even if unchanged')
+    parser.add_argument('--workers', type=int, default=None, help='rendering processes (default: all cores)')
+    parser.add_argument('--start', default=analysis.DATE_RANGE[0], help='first date (inclusive)')
+    parser.add_argument('--end', default=analysis.DATE_RANGE[1], help='last date (inclusive)')
+    parser.add_argument('figures', nargs='*', help='only consider these figure filenames')
+    args = parser.parse_args()
+
+    out_dir, dpi = (preview_dir, PREVIEW_DPI) if args.preview else (figures_dir, PUBLICATION_DPI)
+    rebuilt = build_figures(out_dir, dpi, [args.start, args.end], args.workers, args.force, args.figures)
+    print(f"Rebuilt {len(rebuilt)} figures in {out_dir}" + (f": {', '.join(sorted(rebuilt))}" if rebuilt else ' (all up to date)'))
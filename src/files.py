@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+File helpers shared by the scripts.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, suffix='.tmp'):
+    """
+    Yields a temporary path next to `path` to write to, and moves it over `path` once the block finishes, so readers
+    see the old file or the new one but never a partial write, and a failed or interrupted write leaves `path` as it
+    was. The temporary name is unique to the process and thread, so concurrent writers of one path don't collide, and
+    ends with `suffix` (e.g. '.tmp.png' for writers that pick the format from the extension).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}{suffix}'
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
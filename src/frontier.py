@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Durable crawl frontier in SQLite, so a crawl can be spread over several worker processes and survive restarts.
+Every url is stored once under its normalized form with a state (pending/leased/done/failed), an attempt count and a
+lease expiry; hosts have a next-allowed time. Workers lease batches in a transaction: each leased url gets a start time
+spaced `delay` seconds after the previous request to its host, so politeness holds across all workers. Leases that
+expire (e.g. a killed worker) go back to the queue, and failures are retried up to `max_attempts` times. A worker can
+only complete or fail a url while it still holds the lease, so a slow worker can't overwrite the url's next holder.
+
+    python frontier.py seed                # add the urls of every article list
+    python frontier.py crawl --workers 4   # fetch and extract them into the page cache
+    python frontier.py status
+    python frontier.py export              # write the stored fatal sentences of --sentences jobs to the *_sentences_raw.csv files
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+from collections import namedtuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pandas as pd
+from fetch import PER_HOST_LIMIT, HOST_DELAY
+from client import client
+from sentence_writer import SentenceWriter
+
+frontier_path = '../cache/frontier.sqlite'
+article_list_paths = {'globe': '../data/globe_article_list.csv', 'star': '../data/star_article_list.csv', 'post': '../data/post_article_list.csv'}
+sentences_paths = {'globe': '../data/globe_sentences_raw.csv', 'star': '../data/star_sentences_raw.csv', 'post': '../data/post_sentences_raw.csv'}
+
+BATCH_SIZE = 16
+# a leased url is handed to another worker if not finished by then: long enough for a request through every retry,
+# plus a minute for parsing and tagging, so a slow host isn't fetched twice
+LEASE_SECONDS = client.max_seconds() + 60
+MAX_ATTEMPTS = 3
+THREADS = 4 # fetch threads per worker process
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'cmp')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (kind TEXT, key TEXT, url TEXT, host TEXT, state TEXT DEFAULT 'pending',
+                                 attempts INTEGER DEFAULT 0, lease_expires REAL, worker TEXT, error TEXT, result TEXT,
+                                 added REAL, updated REAL, PRIMARY KEY (kind, key));
+CREATE INDEX IF NOT EXISTS urls_state ON urls (state, host);
+CREATE TABLE IF NOT EXISTS hosts (host TEXT PRIMARY KEY, next_allowed REAL DEFAULT 0);
+"""
+
+Lease = namedtuple('Lease', ['kind', 'key', 'url', 'attempts', 'start_at', 'worker', 'expires'])
+
+
+def normalize_url(url):
+    """returns the dedupe key of a url: lowercase scheme and host, no default port, fragment, tracking params or trailing slash, sorted query"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f'{host}:{parts.port}'
+    path = parts.path.rstrip('/') or '/'
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not name.lower().startswith(TRACKING_PARAMS))
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+class Frontier:
+    """a SQLite crawl frontier shared by any number of processes"""
+
+    def __init__(self, path=frontier_path, delay=HOST_DELAY, per_host=PER_HOST_LIMIT, max_attempts=MAX_ATTEMPTS):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.delay = delay
+        self.per_host = per_host
+        self.max_attempts = max_attempts
+        # autocommit, with explicit transactions where several statements must be atomic
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add(self, urls, kind):
+        """queues `urls` as `kind` jobs, ignoring any whose normalized url is already queued as `kind`; returns the number added"""
+        now = time.time()
+        # the first url seen for a key is the one fetched
+        rows = {}
+        for url in urls:
+            rows.setdefault(normalize_url(url), url)
+
+        self.db.execute('BEGIN IMMEDIATE')
+        before = self.db.total_changes
+        self.db.executemany('INSERT OR IGNORE INTO urls (kind, key, url, host, added, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                            ((kind, key, url, urlsplit(key).netloc, now, now) for key, url in rows.items()))
+        added = self.db.total_changes - before
+        self.db.executemany('INSERT OR IGNORE INTO hosts (host) VALUES (?)', {(urlsplit(key).netloc,) for key in rows})
+        self.db.execute('COMMIT')
+        return added
+
+    def lease(self, worker, n=BATCH_SIZE, lease_seconds=LEASE_SECONDS, kinds=None):
+        """
+        Leases up to `n` runnable urls (pending, or leased with an expired lease) to `worker`, at most `per_host` per host.
+        Each gets a start time `delay` seconds after the previous one on its host, and the host's next-allowed time moves past them.
+        """
+        now = time.time()
+        kind_filter = f"AND kind IN ({','.join('?' * len(kinds))})" if kinds else ''
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            # the oldest `per_host` runnable urls of every host that isn't already booked a full batch ahead
+            rows = self.db.execute(f"""SELECT kind, key, url, host, attempts FROM (
+                                           SELECT *, ROW_NUMBER() OVER (PARTITION BY host ORDER BY added, urls.rowid) AS position FROM urls
+                                           WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) {kind_filter})
+                                       JOIN hosts USING (host)
+                                       WHERE position <= ? AND next_allowed <= ?
+                                       ORDER BY position, added""", [now, *(kinds or []), self.per_host, now + self.delay * self.per_host]).fetchall()
+            next_allowed = dict(self.db.execute('SELECT host, next_allowed FROM hosts'))
+
+            leases = []
+            per_host = {}
+            for kind, key, url, host, attempts in rows[:n]:
+                per_host[host] = per_host.get(host, 0) + 1
+                start_at = max(now, next_allowed.get(host, 0))
+                next_allowed[host] = start_at + self.delay
+                leases.append(Lease(kind, key, url, attempts + 1, start_at, worker, start_at + lease_seconds))
+
+            self.db.executemany("UPDATE urls SET state = 'leased', attempts = attempts + 1, lease_expires = ?, worker = ?, updated = ? WHERE kind = ? AND key = ?",
+                                ((lease.expires, lease.worker, now, lease.kind, lease.key) for lease in leases))
+            self.db.executemany('UPDATE hosts SET next_allowed = ? WHERE host = ?', ((next_allowed[host], host) for host in per_host))
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return leases
+
+    # a lease is only honoured while the url is still leased to the same worker with the same expiry
+    HELD = "kind = ? AND key = ? AND state = 'leased' AND worker = ? AND lease_expires = ?"
+
+    def complete(self, lease, result=None):
+        """
+        Marks a leased url done, storing its json-serializable result if there is one. Returns False (changing nothing)
+        if the lease was lost, i.e. it expired and the url was leased again.
+        """
+        cursor = self.db.execute(f"UPDATE urls SET state = 'done', result = ?, error = NULL, lease_expires = NULL, updated = ? WHERE {self.HELD}",
+                                 (None if result is None else json.dumps(result), time.time(), *self.held(lease)))
+        return cursor.rowcount > 0
+
+    def fail(self, lease, error):
+        """
+        Puts a leased url back in the queue, or marks it failed once it has used up its attempts. Returns False (changing
+        nothing) if the lease was lost.
+        """
+        cursor = self.db.execute(f"""UPDATE urls SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                                     error = ?, lease_expires = NULL, updated = ? WHERE {self.HELD}""",
+                                 (self.max_attempts, error, time.time(), *self.held(lease)))
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def held(lease):
+        return lease.kind, lease.key, lease.worker, lease.expires
+
+    def retry_failed(self, kinds=None):
+        """returns failed urls to the queue with fresh attempts"""
+        kind_filter = f"AND kind IN ({','.join('?' * len(kinds))})" if kinds else ''
+        return self.db.execute(f"UPDATE urls SET state = 'pending', attempts = 0 WHERE state = 'failed' {kind_filter}", kinds or []).rowcount
+
+    def is_finished(self, kinds=None):
+        """returns True when no url is pending or leased"""
+        kind_filter = f"AND kind IN ({','.join('?' * len(kinds))})" if kinds else ''
+        return self.db.execute(f"SELECT COUNT(*) FROM urls WHERE state IN ('pending', 'leased') {kind_filter}", kinds or []).fetchone()[0] == 0
+
+    def counts(self):
+        """returns {(kind, state): number of urls}"""
+        return {(kind, state): n for kind, state, n in self.db.execute('SELECT kind, state, COUNT(*) FROM urls GROUP BY kind, state')}
+
+    def results(self, kind):
+        """returns {url: result} for the finished urls of `kind`"""
+        return {url: json.loads(result) for url, result in
+                self.db.execute("SELECT url, result FROM urls WHERE kind = ? AND state = 'done' AND result IS NOT NULL", (kind,))}
+
+
+def handler(kind):
+    """
+    Returns the function a worker runs for `kind` jobs: '<publication>' runs the publication's article stage (the page
+    and extractor results end up in the page cache), '<publication>_sentences' also stores the article's fatal sentences.
+    """
+    import extractors
+    publication, _, stage = kind.partition('_')
+    article_stage = getattr(extractors, f'{publication}_stage')
+
+    if stage == 'sentences':
+        from extract_sentences import find_fatal_sentences, load_nlp_models
+        load_nlp_models()
+        return lambda url: find_fatal_sentences(extractors.get_text(article_stage, url))
+
+    def fetch(url):
+        extractors.get_text(article_stage, url) # raises for pages without article text, so they're retried
+    return fetch
+
+def crawl_worker(path, kinds=None, batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS, threads=THREADS, delay=HOST_DELAY,
+                 cache_dir=None, offline=False):
+    """
+    Leases and runs batches until the frontier is finished (runs in a worker process). Returns (done, failed, lost) counts,
+    where lost results are those of leases that expired and went to another worker before they finished.
+    """
+    import cache
+    if cache_dir is not None:
+        cache.configure(cache_dir, offline=offline)
+
+    frontier = Frontier(path, delay=delay)
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    handlers = {}
+    done = failed = lost = 0
+
+    def run(lease):
+        time.sleep(max(0, lease.start_at - time.time()))
+        try:
+            return lease, handlers[lease.kind](lease.url), None
+        except Exception as e:
+            return lease, None, e
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            # no more than there are threads, so every url starts at its booked time: one left queued behind a slow
+            # fetch would start late and crowd the next request another worker booked on its host
+            leases = frontier.lease(worker, min(batch_size, threads), lease_seconds, kinds)
+            if not leases:
+                if frontier.is_finished(kinds):
+                    break
+                # everything left is leased by other workers (or waiting on a host), so check back shortly
+                time.sleep(min(delay, 1) or 0.1)
+                continue
+
+            # handlers load their models here, once per process, rather than in every fetch thread at once
+            for kind in {lease.kind for lease in leases} - set(handlers):
+                handlers[kind] = handler(kind)
+
+            for lease, result, error in executor.map(run, leases):
+                if error is None:
+                    held = frontier.complete(lease, result)
+                    done += held
+                else:
+                    held = frontier.fail(lease, f'{type(error).__name__}: {error}')
+                    failed += held
+                if not held:
+                    print(f'Lost the lease on {lease.url} (it expired and was leased again), so its result was dropped')
+                    lost += 1
+
+    frontier.close()
+    return done, failed, lost
+
+def seed(frontier, publications=article_list_paths, sentences=False):
+    """queues every article of the article lists; returns {kind: urls added}"""
+    added = {}
+    for publication, path in publications.items():
+        kind = f'{publication}_sentences' if sentences else publication
+        added[kind] = frontier.add(pd.read_csv(path)['url'].dropna(), kind)
+    return added
+
+def export_sentences(frontier, publications=article_list_paths, paths=sentences_paths):
+    """
+    Writes the fatal sentences stored by '<publication>_sentences' jobs to each publication's sentences csv, through
+    SentenceWriter, in article list order. Articles that aren't done are left out of the checkpoint, as in
+    extract_sentences. Returns {publication: (articles written, sentences written)}.
+    """
+    written = {}
+    for publication, articles_path in publications.items():
+        results = {normalize_url(url): result for url, result in frontier.results(f'{publication}_sentences').items()}
+        df = pd.read_csv(articles_path)
+        writer = SentenceWriter(df, paths[publication])
+        n_articles = 0
+        for i, url in enumerate(df['url']):
+            fatal_sentences = results.get(normalize_url(url)) if isinstance(url, str) else None
+            if fatal_sentences is None:
+                writer.skip(i)
+            else:
+                writer.add(i, fatal_sentences)
+                n_articles += 1
+        writer.close()
+        written[publication] = (n_articles, writer.n_rows)
+    return written
+
+def print_status(frontier):
+    counts = frontier.counts()
+    states = ['pending', 'leased', 'done', 'failed']
+    print(f"{'kind':<16}" + ''.join(f'{state:>9}' for state in states))
+    for kind in sorted({kind for kind, _ in counts}):
+        print(f'{kind:<16}' + ''.join(f'{counts.get((kind, state), 0):>9}' for state in states))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Seed, crawl and inspect the shared crawl frontier.')
+    parser.add_argument('command', choices=['seed', 'crawl', 'status', 'retry', 'export'])
+    parser.add_argument('--frontier', default=frontier_path, help='SQLite frontier path')
+    parser.add_argument('--publications', nargs='+', choices=list(article_list_paths), default=list(article_list_paths))
+    parser.add_argument('--sentences', action='store_true', help='seed: also find and store the fatal sentences of each article')
+    parser.add_argument('--kinds', nargs='+', help='crawl/retry: only these job kinds (e.g. star post_sentences)')
+    parser.add_argument('--workers', type=int, default=4, help='crawl: worker processes (several machines can share the frontier file)')
+    parser.add_argument('--threads', type=int, default=THREADS, help='crawl: fetch threads per worker')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='crawl: urls leased at a time (at most --threads)')
+    parser.add_argument('--delay', type=float, default=HOST_DELAY, help='crawl: seconds between request starts on the same host')
+    parser.add_argument('--offline', action='store_true', help='crawl: replay pages from the cache and never touch the network')
+    parser.add_argument('--cache-dir', default='../cache/html', help='crawl: page cache directory')
+    args = parser.parse_args()
+
+    frontier = Frontier(args.frontier, delay=args.delay)
+    if args.command == 'seed':
+        for kind, n in seed(frontier, {p: article_list_paths[p] for p in args.publications}, args.sentences).items():
+            print(f'{kind}: {n} new urls queued')
+
+    elif args.command == 'crawl':
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(crawl_worker, args.frontier, args.kinds, args.batch_size, LEASE_SECONDS, args.threads,
+                                       args.delay, args.cache_dir, args.offline) for _ in range(args.workers)]
+            results = [future.result() for future in futures]
+        done, failed, lost = (sum(counts) for counts in zip(*results))
+        print(f'{done} done, {failed} failed attempts' + (f', {lost} lost leases' if lost else '') +
+              f' by {args.workers} workers in {time.perf_counter() - start:.1f}s')
+
+    elif args.command == 'retry':
+        print(f'{frontier.retry_failed(args.kinds)} failed urls queued again')
+
+    elif args.command == 'export':
+        for publication, (n_articles, n_rows) in export_sentences(frontier, {p: article_list_paths[p] for p in args.publications}).items():
+            print(f'{publication}: {n_rows} sentences from {n_articles} articles\nSaved to {sentences_paths[publication]}')
+
+    print_status(frontier)
+    frontier.close()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+End-to-end checks of the fetching code against local stand-in servers, so changes to the scheduler, the page cache or
+the scrapers can be tested without touching the real sites. Each publication's fixture pages (benchmarks/fixtures/)
+are served by its own http.server on a local port, which the fetch code treats as a separate host, and every server
+records when each request started and how many were in flight.
+
+    python local_http_check.py            # run every check
+    python local_http_check.py frontier   # or only some of them
+
+Exits with status 1 if any check fails.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import functools
+import weakref
+import http.server
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import cache
+import scrape_globe_articles
+from metrics import failure_reason
+from fetch import fetch_in_order, fetch_as_completed, WINDOW
+from frontier import Frontier, crawl_worker
+from extractors import globe_stage, star_stage, post_stage
+
+fixtures_dir = '../benchmarks/fixtures'
+
+LATENCY = 0.5 # seconds each stand-in response takes, longer than the delay so requests to a host overlap
+PER_HOST_LIMIT = 2
+HOST_DELAY = 0.2
+JITTER = 0.25 # fraction of the delay that request arrivals may drift from the client's spacing (thread scheduling on a busy machine)
+OFFLINE_DELAY = 0.5 # politeness delay for the offline replay, which should never wait for it
+CRAWL_WORKERS = 3
+
+failures = []
+
+
+class StandInServer:
+    """serves a directory over http on a free local port in a background thread, recording request starts and concurrency"""
+
+    def __init__(self, directory, latency=LATENCY):
+        server = self
+
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            # the real sites send utf-8, and the client decodes by the declared charset
+            extensions_map = {**http.server.SimpleHTTPRequestHandler.extensions_map, '.html': 'text/html; charset=utf-8'}
+
+            def do_GET(self):
+                with server.lock:
+                    server.starts.append(time.monotonic())
+                    server.paths.append(self.path)
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(server.latency)
+                finally:
+                    # counted out before the response goes back, since the client may send its next request as soon as it arrives
+                    with server.lock:
+                        server.in_flight -= 1
+                super().do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=directory))
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self.reset()
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def reset(self):
+        with self.lock:
+            self.starts = []
+            self.paths = []
+            self.in_flight = 0
+            self.max_in_flight = 0
+
+    def min_gap(self):
+        """shortest time between two consecutive request starts (inf for fewer than two requests)"""
+        starts = sorted(self.starts)
+        return min((b - a for a, b in zip(starts, starts[1:])), default=float('inf'))
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def check(name, ok, detail=''):
+    print(f"{'ok' if ok else 'FAILED':<7} {name}{': ' + detail if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+def article_urls(server, publication):
+    names = sorted(name for name in os.listdir(os.path.join(fixtures_dir, publication)) if name.startswith('article_'))
+    return [f'{server.url}/{name}' for name in names]
+
+def start_servers(publications):
+    return {publication: StandInServer(os.path.join(fixtures_dir, publication)) for publication in publications}
+
+
+def check_fetch():
+    """concurrent fetching gives the serial results, keeps to the per-host limit and delay, and replays offline without waiting"""
+    stages = {'globe': globe_stage, 'star': star_stage, 'post': post_stage}
+    servers = start_servers(stages)
+    urls = {publication: article_urls(server, publication) for publication, server in servers.items()}
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cache.configure(enabled=False)
+        serial = {publication: stage.run(urls[publication], max_workers=1, per_host_limit=1, delay=0)
+                  for publication, stage in stages.items()}
+
+        # every publication on one pool, as extract_sentences runs them
+        for server in servers.values():
+            server.reset()
+        cache.configure(os.path.join(cache_dir, 'html'))
+        jobs = [(stages[publication].extract, url) for publication in stages for url in urls[publication]]
+        fetched = iter(fetch_in_order(jobs, max_workers=8, per_host_limit=PER_HOST_LIMIT, delay=HOST_DELAY))
+        concurrent = {publication: [next(fetched) for _ in urls[publication]] for publication in stages}
+        results = lambda runs: {publication: [(result, repr(error)) for result, error in run] for publication, run in runs.items()}
+        check('concurrent results match serial', results(concurrent) == results(serial))
+        for publication, server in servers.items():
+            check(f'{publication} host limit', 1 < server.max_in_flight <= PER_HOST_LIMIT,
+                  f'{server.max_in_flight} in flight at most (limit {PER_HOST_LIMIT})')
+            check(f'{publication} host delay', server.min_gap() >= HOST_DELAY * (1 - JITTER),
+                  f'requests started {server.min_gap():.3f}s apart at the closest (delay {HOST_DELAY}s)')
+
+        # an error page is a failure with its status, not an article
+        for publication, stage in stages.items():
+            [(_, error)] = stage.run([f'{servers[publication].url}/missing.html'], max_workers=1, delay=0)
+            reason = None if error is None else failure_reason(error)
+            check(f'{publication} error page fails as http_404', reason == 'http_404', f'{reason}')
+
+        # an offline rerun is answered from the cache and must not wait for the politeness delay
+        for server in servers.values():
+            server.reset()
+        cache.configure(os.path.join(cache_dir, 'html'), offline=True)
+        start = time.perf_counter()
+        offline = {publication: stage.run(urls[publication], max_workers=8, per_host_limit=PER_HOST_LIMIT, delay=OFFLINE_DELAY)
+                   for publication, stage in stages.items()}
+        elapsed = time.perf_counter() - start
+        n_requests = sum(len(server.starts) for server in servers.values())
+        check('offline replay matches', results(offline) == results(serial))
+        check('offline replay makes no requests', n_requests == 0, f'{n_requests} requests')
+        check('offline replay is not throttled', elapsed < OFFLINE_DELAY, f'{elapsed:.2f}s for {sum(map(len, urls.values()))} pages')
+
+        # results the caller has consumed must be freed, so streaming a large run keeps memory flat
+        class Page:
+            def __init__(self):
+                self.html = bytearray(1 << 20)
+        alive = []
+        def page(url):
+            result = Page()
+            alive.append(weakref.ref(result))
+            return result
+        held = 0
+        for _, result, _ in fetch_as_completed([(page, url) for url in urls['globe'] * 25], max_workers=4, delay=0):
+            del result
+            held = max(held, sum(ref() is not None for ref in alive))
+        check('fetching holds a bounded window of results', held <= 4 * WINDOW, f'{held} of {len(alive)} results held at most')
+    finally:
+        cache.configure(enabled=False)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        for server in servers.values():
+            server.close()
+
+def check_frontier():
+    """several crawl workers share the frontier: each page is fetched once, hosts are spaced, and stale leases can't finish"""
+    publications = ['globe', 'star', 'post']
+    servers = start_servers(publications)
+    missing = {publication: f'{server.url}/missing.html' for publication, server in servers.items()}
+    work_dir = tempfile.mkdtemp()
+    path = os.path.join(work_dir, 'frontier.sqlite')
+    try:
+        frontier = Frontier(path, delay=HOST_DELAY)
+        for publication, server in servers.items():
+            frontier.add(article_urls(server, publication) + [missing[publication]], publication)
+
+        # spawned, so the workers don't inherit the servers' threads
+        with ProcessPoolExecutor(CRAWL_WORKERS, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(crawl_worker, path, threads=2, delay=HOST_DELAY,
+                                       cache_dir=os.path.join(work_dir, 'html')) for _ in range(CRAWL_WORKERS)]
+            results = [future.result() for future in futures]
+
+        counts = frontier.counts()
+        n_pages = sum(len(article_urls(server, publication)) for publication, server in servers.items())
+        done = sum(counts.get((publication, 'done'), 0) for publication in publications)
+        failed = sum(counts.get((publication, 'failed'), 0) for publication in publications)
+        check('every page done', done == n_pages and failed == len(missing), f'{done} done, {failed} failed of {n_pages} pages + {len(missing)} missing')
+        workers = {worker for worker, in frontier.db.execute("SELECT DISTINCT worker FROM urls WHERE state = 'done'")}
+        check('workers shared the crawl', len(workers) > 1, f'{len(workers)} of {CRAWL_WORKERS} workers finished pages')
+        check('no leases lost', sum(lost for _, _, lost in results) == 0)
+        for publication, server in servers.items():
+            requests = Counter(server.paths)
+            missing_path = '/missing.html'
+            repeated = [path for path, n in requests.items() if n > 1 and path != missing_path]
+            check(f'{publication} pages fetched once', not repeated, f'{len(repeated)} pages fetched more than once')
+            check(f'{publication} missing page retried', requests[missing_path] == frontier.max_attempts,
+                  f'{requests[missing_path]} requests (max attempts {frontier.max_attempts})')
+            check(f'{publication} host delay across workers', server.min_gap() >= HOST_DELAY * (1 - JITTER),
+                  f'requests started {server.min_gap():.3f}s apart at the closest (delay {HOST_DELAY}s)')
+
+        # a worker whose lease expired while the url went to another worker can't finish or requeue it
+        frontier.add([f'{servers["globe"].url}/stale.html'], 'stale')
+        frontier.delay = 0
+        stale, = frontier.lease('slow-worker', lease_seconds=0, kinds=['stale'])
+        time.sleep(0.01)
+        current, = frontier.lease('next-worker', kinds=['stale'])
+        check('stale lease cannot complete', not frontier.complete(stale, 'stale result'))
+        check('stale lease cannot fail', not frontier.fail(stale, 'stale error'))
+        state = frontier.db.execute("SELECT state, worker, result FROM urls WHERE kind = 'stale'").fetchone()
+        check('next holder keeps the url', state == ('leased', 'next-worker', None), f'{state}')
+        check('next holder can complete', frontier.complete(current, 'result') and frontier.results('stale') == {current.url: 'result'})
+        frontier.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        for server in servers.values():
+            server.close()
+
+def check_globe():
+    """the globe scraper pages through the feed to the start date, and falls back to Selenium (keeping the published list) when the feed ends early"""
+    globe = scrape_globe_articles
+    server = StandInServer(os.path.join(fixtures_dir, 'globe'), latency=0)
+    work_dir = tempfile.mkdtemp()
+    path = os.path.join(work_dir, 'globe_article_list.csv')
+    # there's no browser here, so the fallback only records that it ran
+    fallbacks = []
+    def scrape_with_selenium():
+        fallbacks.append(True)
+        raise RuntimeError('no browser for the Selenium fallback')
+    original, globe.scrape_with_selenium = globe.scrape_with_selenium, scrape_with_selenium
+    try:
+        cache.configure(enabled=False)
+        n_articles = globe.scrape(path, f'{server.url}/search_{{page}}.html')
+        published = pd.read_csv(globe.filename, dtype=str)
+        expected = published[published['datetime'] >= globe.date_start].reset_index(drop=True)
+        scraped = pd.read_csv(path, dtype=str)
+        check('globe feed matches the article list', scraped.equals(expected) and n_articles == len(expected),
+              f'{len(scraped)} articles from {len(server.paths)} feed pages, {len(expected)} expected')
+        check('globe feed needs no fallback', not fallbacks)
+
+        # a site that ignores the page number serves the first page forever, which must not pass for the whole feed
+        with open(path, 'rb') as f:
+            before = f.read()
+        try:
+            globe.scrape(path, f'{server.url}/search_0.html?page={{page}}')
+        except RuntimeError:
+            pass
+        check('globe falls back when the feed ends early', fallbacks == [True], f'Selenium fallback ran {len(fallbacks)} times')
+        with open(path, 'rb') as f:
+            check('globe keeps the published list when scraping fails', f.read() == before)
+    finally:
+        globe.scrape_with_selenium = original
+        shutil.rmtree(work_dir, ignore_errors=True)
+        server.close()
+
+
+CHECKS = {'fetch': check_fetch, 'frontier': check_frontier, 'globe': check_globe}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check the fetching code end to end against local stand-in servers.')
+    parser.add_argument('checks', nargs='*', default=list(CHECKS), help=f"checks to run (default: all of {', '.join(CHECKS)})")
+    args = parser.parse_args()
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)}")
+
+    for name in args.checks:
+        print(f'{name}: {CHECKS[name].__doc__}')
+        CHECKS[name]()
+
+    if failures:
+        print(f"\n{len(failures)} checks failed: {', '.join(failures)}")
+        sys.exit(1)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Run metrics shared by every stage of the pipeline: per-stage timings, counters and categorized failures.
+With `--metrics PATH` every fetch, parse, nlp batch and failure is also written to PATH as one json object per line,
+and an end-of-run summary table shows where the time went (e.g. whether a slow run is network-bound or NLP-bound).
+`--profile STAGE` runs cProfile (or pyinstrument) around every call of one stage and writes the combined profile.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+import requests
+
+PROFILE_DIR = '../cache/profiles'
+PROFILE_STAGES = ['fetch', 'parse', 'nlp']
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30] # upper bounds in seconds
+
+
+def percentile(values, q):
+    """returns the `q` quantile (0-1) of a list of numbers by nearest rank"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def histogram(values, buckets=LATENCY_BUCKETS):
+    """returns {'<=bound': count} for each bucket, plus '>last' for larger values"""
+    counts = {f'<={bound}': 0 for bound in buckets}
+    counts[f'>{buckets[-1]}'] = 0
+    for value in values:
+        bound = next((bound for bound in buckets if value <= bound), None)
+        counts[f'<={bound}' if bound is not None else f'>{buckets[-1]}'] += 1
+    return counts
+
+def failure_reason(error):
+    """returns a short category for why a fetch or parse failed, e.g. 'http_403', 'timeout' or the exception type"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f'http_{error.response.status_code}'
+    if isinstance(error, requests.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.ConnectionError):
+        return 'connection'
+    return type(error).__name__
+
+
+class Profiler:
+    """accumulates a cProfile or pyinstrument profile over every call of one stage, one call at a time"""
+
+    def __init__(self, stage, tool='cprofile', profile_dir=PROFILE_DIR):
+        self.stage = stage
+        self.tool = tool
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._profiler = None
+
+    def path(self):
+        extension = 'html' if self.tool == 'pyinstrument' else 'prof'
+        return os.path.join(self.profile_dir, f'{self.stage}-{os.getpid()}.{extension}')
+
+    @contextmanager
+    def profile(self):
+        # only one profiler can run at a time, so concurrent calls from other threads run unprofiled
+        if not self._lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            if self._profiler is None:
+                if self.tool == 'pyinstrument':
+                    from pyinstrument import Profiler as Pyinstrument
+                    self._profiler = Pyinstrument()
+                else:
+                    import cProfile
+                    self._profiler = cProfile.Profile()
+
+            if self.tool == 'pyinstrument':
+                self._profiler.start()
+            else:
+                self._profiler.enable()
+            try:
+                yield
+            finally:
+                if self.tool == 'pyinstrument':
+                    self._profiler.stop()
+                else:
+                    self._profiler.disable()
+                self.save()
+        finally:
+            self._lock.release()
+
+    def save(self):
+        # saved after every call, since pool workers exit without running cleanup handlers
+        os.makedirs(self.profile_dir, exist_ok=True)
+        if self.tool == 'pyinstrument':
+            with open(self.path(), 'w') as f:
+                f.write(self._profiler.output_html())
+        else:
+            self._profiler.dump_stats(self.path())
+
+
+class Metrics:
+    """thread-safe timings, counters and failures, optionally streamed as json lines"""
+
+    def __init__(self):
+        self.timings = {} # stage -> list of seconds
+        self.counters = Counter()
+        self.failures = Counter() # (stage, reason) -> count
+        self.profiler = None
+        self._out = None
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def reset(self):
+        """forgets everything recorded and stops writing json lines (pool workers start with this)"""
+        self.__init__()
+
+    def configure(self, path=None, profile_stage=None, profiler='cprofile'):
+        """starts writing json lines to `path` and profiling `profile_stage` (either may be None)"""
+        if path:
+            self._out = open(path, 'a', encoding='utf-8', buffering=1)
+        if profile_stage:
+            self.profiler = Profiler(profile_stage, profiler)
+        self._start = time.perf_counter()
+
+    def emit(self, event, **fields):
+        """writes one json line, if a metrics file is configured"""
+        if self._out is None:
+            return
+        line = json.dumps({'time': round(time.time(), 3), 'event': event, **fields}, default=str)
+        with self._lock:
+            self._out.write(line + '\n')
+
+    def record(self, stage, seconds, **fields):
+        """adds one timing sample to `stage`"""
+        with self._lock:
+            self.timings.setdefault(stage, []).append(seconds)
+        self.emit(stage, seconds=round(seconds, 6), **fields)
+
+    @contextmanager
+    def timer(self, stage, **fields):
+        """times the block as one sample of `stage`, profiling it if `stage` is the profiled stage"""
+        profiled = self.profiler is not None and self.profiler.stage == stage
+        start = time.perf_counter()
+        try:
+            if profiled:
+                with self.profiler.profile():
+                    yield
+            else:
+                yield
+        finally:
+            self.record(stage, time.perf_counter() - start, **fields)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def failure(self, stage, error, **fields):
+        """records a categorized failure of `stage` and returns its reason"""
+        reason = failure_reason(error)
+        with self._lock:
+            self.failures[(stage, reason)] += 1
+        self.emit('failure', stage=stage, reason=reason, error=str(error), **fields)
+        return reason
+
+    def take(self):
+        """returns and clears the timings and counters recorded so far (used to send pool worker metrics back)"""
+        with self._lock:
+            snapshot = {'timings': self.timings, 'counters': dict(self.counters)}
+            self.timings = {}
+            self.counters = Counter()
+        return snapshot
+
+    def merge(self, snapshot, event=None, **fields):
+        """adds timings and counters taken from another process, emitting them as one `event` line"""
+        with self._lock:
+            for stage, samples in snapshot['timings'].items():
+                self.timings.setdefault(stage, []).extend(samples)
+            self.counters.update(snapshot['counters'])
+        if event:
+            self.emit(event, seconds={stage: round(sum(samples), 6) for stage, samples in snapshot['timings'].items()},
+                      counts=snapshot['counters'], **fields)
+
+    def summary(self):
+        """returns per-stage timing statistics"""
+        return {stage: {'n': len(samples), 'total': sum(samples), 'mean': sum(samples) / len(samples),
+                        'p50': percentile(samples, 0.5), 'p90': percentile(samples, 0.9), 'max': max(samples)}
+                for stage, samples in self.timings.items() if samples}
+
+    def print_summary(self):
+        """prints the timing table, hit ratios, counters and failure reasons, and emits them as a summary line"""
+        wall = time.perf_counter() - self._start
+        summary = self.summary()
+
+        print(f"\n{'stage':<16} {'n':>7} {'total s':>9} {'mean ms':>9} {'p50 ms':>8} {'p90 ms':>8} {'max ms':>8}")
+        for stage, stats in sorted(summary.items(), key=lambda item: -item[1]['total']):
+            print(f"{stage:<16} {stats['n']:>7} {stats['total']:>9.1f} {stats['mean'] * 1000:>9.1f} "
+                  f"{stats['p50'] * 1000:>8.1f} {stats['p90'] * 1000:>8.1f} {stats['max'] * 1000:>8.1f}")
+        print(f'wall time: {wall:.1f}s (stage totals add up time across threads and processes)')
+
+        # hits / (hits + misses) for every counter pair like cache.hits and cache.misses
+        prefixes = {name.rsplit('.', 1)[0] for name in self.counters if name.endswith(('.hits', '.misses'))}
+        for prefix in sorted(prefixes):
+            hits = self.counters[prefix + '.hits']
+            total = hits + self.counters[prefix + '.misses']
+            print(f'{prefix} hit ratio: {hits / max(total, 1):.1%} ({hits} of {total})')
+        other = {name: n for name, n in self.counters.items() if not name.endswith(('.hits', '.misses'))}
+        if other:
+            print(', '.join(f'{name}: {n}' for name, n in sorted(other.items())))
+
+        if self.failures:
+            print('failures: ' + ', '.join(f'{stage} {reason}: {n}' for (stage, reason), n in self.failures.most_common()))
+
+        self.emit('summary', wall=round(wall, 3), stages=summary, counters=dict(self.counters),
+                  failures={f'{stage}:{reason}': n for (stage, reason), n in self.failures.items()})
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+
+# shared metrics for the whole run
+metrics = Metrics()
+
+def add_metrics_args(parser):
+    """adds the metrics and profiling options to an argparse parser"""
+    parser.add_argument('--metrics', metavar='PATH', help='append structured run metrics to PATH as json lines')
+    parser.add_argument('--profile', choices=PROFILE_STAGES, help=f'profile every call of one stage (written to {PROFILE_DIR}/)')
+    parser.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], default='cprofile')
+
+def configure_metrics_from_args(args):
+    """sets up the shared metrics from options added by add_metrics_args"""
+    metrics.configure(args.metrics, args.profile, args.profiler)
+    return metrics
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Targeted parsers for the known page layouts. Each extractor only needs a few nodes, so instead of building a full
+BeautifulSoup tree for every page they can use direct lxml/XPath selectors ('lxml') or SoupStrainer-restricted parsing
+('strainer'). Full BeautifulSoup ('soup') is the reference, and the fallback whenever a faster parser fails on a page.
+"""
+
+import lxml.html
+from bs4 import BeautifulSoup, SoupStrainer
+
+STRATEGY = 'lxml' # 'lxml', 'strainer' or 'soup'
+
+
+def has_class(name):
+    """xpath predicate matching elements with `name` as one of their classes (like BeautifulSoup's class matching)"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+def class_matcher(name):
+    """SoupStrainer class matcher: strainers see the raw class string, so a plain class_ only matches single-class tags"""
+    return lambda classes: classes is not None and name in classes.split()
+
+def parse_tree(html):
+    """parses html into an lxml tree"""
+    return lxml.html.fromstring(html)
+
+
+# full BeautifulSoup (reference)
+def soup_star_text(soup):
+    article_body = soup.find('div', attrs={'id': 'article-body'})
+    text = ''
+
+    for div in article_body.find_all('div', {'class': ['subscriber-preview', 'subscriber-only']}):
+        if 'hidden-print' not in div['class']:
+            try:
+                text += ' ' + div.find('p').text
+            except:
+                pass
+
+    return text
+
+def soup_star_tag(soup):
+    return soup.find_all('span', {'itemprop': 'name'})[-1].text
+
+def soup_star_keywords(soup):
+    article_keywords_string = soup.find('meta', attrs={'name': 'keywords'})['content']
+    return article_keywords_string.replace(',', '').split(' ')
+
+def soup_post_text(soup):
+    text = ''
+
+    paragraphs = soup.find_all('p', class_='', attrs='')
+    for paragraph in paragraphs:
+        text += ' ' + paragraph.text
+
+    return text
+
+def soup_post_cards(soup):
+    cards = []
+    for article in soup.find_all('div', class_='article-card__details'):
+        cards.append((article.find('span', class_='article-card__headline-clamp').text,
+                      article.find('a')['href'],
+                      article.find('span', {'data-evt-skip-click': 'true'}).text,
+                      article.find('span', class_='article-card__time-clamp').text))
+    return cards
+
+def soup_star_cards(soup):
+    cards = []
+    for article in soup.find_all('article'):
+        article_info = article.find('a', class_='tnt-asset-link')
+        try:
+            tag = article.find('span', class_='tnt-flag').text.replace('\n', '')
+        except: # some articles have weird tags
+            tag = article.find('span').text
+        cards.append((article_info['href'], article_info['aria-label'], article.find('time')['datetime'], tag))
+    return cards
+
+def soup_globe_cards(soup):
+    cards = []
+    for article in soup.find_all('div', class_='c-card'):
+        cards.append((article.find('time')['datetime'],
+                      article.find('div', class_='c-card__hed-text').text,
+                      article.find('a')['href'],
+                      article.find('span').text))
+    return cards
+
+
+# direct lxml/xpath selectors
+def lxml_star_text(tree):
+    article_body = tree.xpath("//div[@id='article-body']")[0]
+    text = ''
+
+    divs = article_body.xpath(f".//div[({has_class('subscriber-preview')} or {has_class('subscriber-only')}) and not({has_class('hidden-print')})]")
+    for div in divs:
+        paragraphs = div.xpath('(.//p)[1]')
+        if paragraphs:
+            text += ' ' + paragraphs[0].text_content()
+
+    return text
+
+def lxml_star_tag(tree):
+    return tree.xpath("//span[@itemprop='name']")[-1].text_content()
+
+def lxml_star_keywords(tree):
+    article_keywords_string = tree.xpath("//meta[@name='keywords']/@content")[0]
+    return article_keywords_string.replace(',', '').split(' ')
+
+def lxml_post_text(tree):
+    text = ''
+
+    # paragraphs without a class (or with an empty one)
+    for paragraph in tree.xpath("//p[not(@class) or normalize-space(@class)='']"):
+        text += ' ' + paragraph.text_content()
+
+    return text
+
+def lxml_post_cards(tree):
+    cards = []
+    for article in tree.xpath(f"//div[{has_class('article-card__details')}]"):
+        cards.append((article.xpath(f"(.//span[{has_class('article-card__headline-clamp')}])[1]")[0].text_content(),
+                      article.xpath('(.//a)[1]/@href')[0],
+                      article.xpath("(.//span[@data-evt-skip-click='true'])[1]")[0].text_content(),
+                      article.xpath(f"(.//span[{has_class('article-card__time-clamp')}])[1]")[0].text_content()))
+    return cards
+
+def lxml_star_cards(tree):
+    cards = []
+    for article in tree.xpath('//article'):
+        article_info = article.xpath(f"(.//a[{has_class('tnt-asset-link')}])[1]")[0]
+        flags = article.xpath(f"(.//span[{has_class('tnt-flag')}])[1]")
+        if flags:
+            tag = flags[0].text_content().replace('\n', '')
+        else: # some articles have weird tags
+            tag = article.xpath('(.//span)[1]')[0].text_content()
+        cards.append((article_info.attrib['href'], article_info.attrib['aria-label'], article.xpath('(.//time)[1]/@datetime')[0], tag))
+    return cards
+
+def lxml_globe_cards(tree):
+    cards = []
+    for article in tree.xpath(f"//div[{has_class('c-card')}]"):
+        cards.append((article.xpath('(.//time)[1]/@datetime')[0],
+                      article.xpath(f"(.//div[{has_class('c-card__hed-text')}])[1]")[0].text_content(),
+                      article.xpath('(.//a)[1]/@href')[0],
+                      article.xpath('(.//span)[1]')[0].text_content()))
+    return cards
+
+
+# SoupStrainer-restricted parsing: only the subtrees each extractor reads are built
+STRAINERS = {'star_text': SoupStrainer('div', attrs={'id': 'article-body'}),
+             'star_tag': SoupStrainer('span', attrs={'itemprop': 'name'}),
+             'star_keywords': SoupStrainer('meta', attrs={'name': 'keywords'}),
+             'post_text': SoupStrainer('p'),
+             'post_cards': SoupStrainer('div', class_=class_matcher('article-card__details')),
+             'star_cards': SoupStrainer('article'),
+             'globe_cards': SoupStrainer('div', class_=class_matcher('c-card'))}
+
+SOUP_PARSERS = {'star_text': soup_star_text,
+                'star_tag': soup_star_tag,
+                'star_keywords': soup_star_keywords,
+                'post_text': soup_post_text,
+                'post_cards': soup_post_cards,
+                'star_cards': soup_star_cards,
+                'globe_cards': soup_globe_cards}
+
+LXML_PARSERS = {'star_text': lxml_star_text,
+                'star_tag': lxml_star_tag,
+                'star_keywords': lxml_star_keywords,
+                'post_text': lxml_post_text,
+                'post_cards': lxml_post_cards,
+                'star_cards': lxml_star_cards,
+                'globe_cards': lxml_globe_cards}
+
+
+def parse_html(name, html, strategy):
+    """runs the `name` parser on raw html with one strategy and no fallback (used by the benchmark)"""
+    if strategy == 'lxml':
+        return LXML_PARSERS[name](parse_tree(html))
+    elif strategy == 'strainer':
+        return SOUP_PARSERS[name](BeautifulSoup(html, 'lxml', parse_only=STRAINERS[name]))
+    return SOUP_PARSERS[name](BeautifulSoup(html, 'lxml'))
+
+def parse(name, page, strategy=None):
+    """
+    Runs the `name` parser on a Page with `strategy` (default STRATEGY), reusing the page's parsed trees.
+    If a faster strategy fails the full BeautifulSoup parser is used, so failures are the same as before.
+    """
+    strategy = strategy or STRATEGY
+    if strategy != 'soup':
+        try:
+            if strategy == 'lxml':
+                return LXML_PARSERS[name](page.tree)
+            return SOUP_PARSERS[name](BeautifulSoup(page.html, 'lxml', parse_only=STRAINERS[name]))
+        except Exception:
+            pass
+
+    return SOUP_PARSERS[name](page.soup)
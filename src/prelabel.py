@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Suggests victim/responsible labels for extracted sentences, with a confidence for each, so reviewers only need to read
+the rows the labeller is unsure about. Each label column gets a softmax regression over hashed features of the sentence:
+word unigrams and bigrams, plus pattern cues for nationality and actor terms (Israeli, Palestinian, Hamas, Israeli
+forces) and where they sit relative to fatal terms (before or after a "killed" within a few words). Training and
+prediction are vectorized over whole DataFrames and only need numpy.
+
+    python prelabel.py evaluate         # cross-validated accuracy on the labelled data/*_sentences.csv
+    python prelabel.py label --write    # add suggestions to the unlabelled data/*_sentences_raw.csv
+"""
+
+import re
+import glob
+import time
+import zlib
+import argparse
+import numpy as np
+import pandas as pd
+
+LABEL_COLUMNS = ['victim', 'responsible']
+labelled_paths = ['../data/globe_sentences.csv', '../data/star_sentences.csv', '../data/post_sentences.csv']
+unlabelled_paths = sorted(glob.glob('../data/*_sentences_raw.csv'))
+
+# single-token pattern cues; the model learns how much each one (and its position) counts for each label. Sentences are
+# split into \w+ words, so multi-word names are cued by their parts: 'kfar' 'aza' (Kfar Aza), 'west' 'bank' (the West
+# Bank), and 'more' 'than' with 'least' for tolls given as "more than N"/"at least N". 'festival' is the Nova music
+# festival and 'camp' the refugee camps (Jabalia, Nuseirat, Jenin), where many of each group's deaths were reported.
+CUES = {'israeli': ['israel', 'israeli', 'israelis', 'jewish', 'jews', 'jew', 'kibbutz', 'kfar', 'aza', 'sderot', 'festival'],
+        'palestinian': ['palestinian', 'palestinians', 'palestine', 'gaza', 'gazan', 'gazans', 'rafah', 'younis', 'jabaliya',
+                        'jabalia', 'shifa', 'ahli', 'camp', 'west', 'bank', 'unrwa', 'civilians'],
+        'hamas': ['hamas', 'militant', 'militants', 'terrorist', 'terrorists', 'terror', 'gunmen', 'jihad', 'hezbollah',
+                  'rockets', 'rocket', 'attackers', 'fighters'],
+        'israel_forces': ['idf', 'military', 'army', 'troops', 'soldiers', 'airstrike', 'airstrikes', 'strike', 'strikes',
+                          'bombardment', 'bombing', 'bombs', 'shelling', 'siege', 'offensive', 'retaliation', 'netanyahu'],
+        'ministry': ['ministry', 'authorities', 'officials'],
+        'toll': ['toll', 'tally', 'least', 'more', 'than', 'number']}
+FATAL_TERMS = ['kill', 'kills', 'killed', 'killing', 'killings', 'die', 'dies', 'died', 'dying', 'dead', 'death', 'deaths',
+               'deceased', 'murder', 'murders', 'murdered', 'massacre', 'massacred', 'slaughter', 'slaughtered', 'execute',
+               'executed', 'behead', 'beheaded', 'shoot', 'shot', 'shooting', 'stab', 'stabbed', 'assassinate',
+               'assassinated', 'fatality', 'fatalities', 'corpse', 'corpses', 'bodies', 'homicide', 'hanged']
+CUE_WINDOW = 5 # words on either side of a fatal term that count as near it
+
+N_FEATURES = 2**18
+EPOCHS = 100
+LEARNING_RATE = 0.05
+L2 = 1e-4
+N_FOLDS = 5
+SEED = 1
+THRESHOLD = 0.8 # suggestions below this confidence are flagged for review
+CONFIDENCE_LEVELS = [0.5, 0.6, 0.7, 0.8, 0.9]
+
+TOKEN_CUES = {token: cue for cue, tokens in CUES.items() for token in tokens}
+FATAL_SET = set(FATAL_TERMS)
+
+
+def sentence_features(sentence):
+    """returns the feature strings of a sentence: words, bigrams, cues, and cues before/after a nearby fatal term"""
+    words = re.findall(r'\w+', sentence.lower())
+    features = ['bias']
+    features += ['w:' + word for word in words]
+    features += ['b:' + first + ' ' + second for first, second in zip(words, words[1:])]
+
+    fatal = [i for i, word in enumerate(words) if word in FATAL_SET]
+    for i, word in enumerate(words):
+        cue = TOKEN_CUES.get(word)
+        if cue is None:
+            continue
+        features.append('cue:' + cue)
+        for j in fatal:
+            if abs(i - j) <= CUE_WINDOW:
+                features.append(f"near:{cue}:{'before' if i < j else 'after'}")
+                features.append(f"near:{cue}:{'before' if i < j else 'after'}:{words[j]}")
+    if fatal:
+        features.append('fatal')
+    return features
+
+def featurize(sentences, n_features=N_FEATURES):
+    """
+    Hashes the features of every sentence into a sparse binary matrix in CSR form, returned as (indices, values, indptr)
+    with each row scaled to unit length. Every row has at least the bias feature, so no row is empty.
+    """
+    rows = [sorted({zlib.crc32(feature.encode('utf-8')) % n_features for feature in sentence_features(sentence)})
+            for sentence in sentences]
+    lengths = np.array([len(row) for row in rows], dtype=np.int64) # int even with no rows, so an empty csv gives empty arrays
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    indices = np.fromiter((i for row in rows for i in row), dtype=np.int64, count=int(indptr[-1]))
+    values = np.repeat(1 / np.sqrt(lengths), lengths)
+    return indices, values, indptr
+
+def scores(weights, indices, values, indptr):
+    """multiplies the CSR feature matrix by the weights"""
+    return np.add.reduceat(weights[indices] * values[:, None], indptr[:-1], axis=0)
+
+def softmax(scores):
+    exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class LinearLabeler:
+    """multinomial logistic regression on hashed sentence features, trained with full-batch Adam"""
+
+    def __init__(self, n_features=N_FEATURES, epochs=EPOCHS, learning_rate=LEARNING_RATE, l2=L2):
+        self.n_features = n_features
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.classes = None
+        self.weights = None
+
+    def fit(self, sentences, labels):
+        indices, values, indptr = featurize(sentences, self.n_features)
+        self.classes, y = np.unique(np.asarray(labels, dtype=object), return_inverse=True)
+        n, k = len(y), len(self.classes)
+        targets = np.eye(k)[y]
+        rows = np.repeat(np.arange(n), np.diff(indptr))
+
+        # only features seen in training get nonzero weights, so train on those alone
+        seen, local = np.unique(indices, return_inverse=True)
+        weights = np.zeros((len(seen), k))
+        m = np.zeros_like(weights)
+        v = np.zeros_like(weights)
+        for epoch in range(1, self.epochs + 1):
+            errors = (softmax(scores(weights, local, values, indptr)) - targets) / n
+            grad = np.stack([np.bincount(local, weights=values * errors[rows, c], minlength=len(seen))
+                             for c in range(k)], axis=1) + self.l2 * weights
+            m = 0.9 * m + 0.1 * grad
+            v = 0.999 * v + 0.001 * grad**2
+            weights -= self.learning_rate * (m / (1 - 0.9**epoch)) / (np.sqrt(v / (1 - 0.999**epoch)) + 1e-8)
+
+        self.weights = np.zeros((self.n_features, k))
+        self.weights[seen] = weights
+        return self
+
+    def predict_proba(self, sentences):
+        return softmax(scores(self.weights, *featurize(sentences, self.n_features)))
+
+    def predict(self, sentences):
+        """returns the most likely label of each sentence and its probability"""
+        probabilities = self.predict_proba(sentences)
+        return self.classes[probabilities.argmax(axis=1)], probabilities.max(axis=1)
+
+
+def load_labelled(paths=labelled_paths):
+    """concatenates the labelled csvs, keeping which file each row came from"""
+    frames = {path: pd.read_csv(path, index_col=0) for path in paths}
+    return pd.concat(frames.values(), keys=frames.keys(), names=['path', None]).reset_index(level='path')
+
+def fit_labellers(df, columns=LABEL_COLUMNS):
+    """trains one labeller per label column on the rows that have that label"""
+    labellers = {}
+    for column in columns:
+        labelled = df[df[column].notna()]
+        labellers[column] = LinearLabeler().fit(labelled['sentence'].tolist(), labelled[column].tolist())
+    return labellers
+
+def suggest_labels(df, labellers, threshold=THRESHOLD):
+    """adds <column>_suggested and <column>_confidence for each labeller, and needs_review where any is below threshold"""
+    df = df.copy()
+    needs_review = np.zeros(len(df), dtype=bool)
+    for column, labeller in labellers.items():
+        labels, confidence = labeller.predict(df['sentence'].tolist())
+        df[f'{column}_suggested'] = labels
+        df[f'{column}_confidence'] = confidence.round(3)
+        needs_review |= confidence < threshold
+    df['needs_review'] = needs_review
+    return df
+
+def group_folds(groups, n_folds=N_FOLDS, seed=SEED):
+    """assigns each row a fold so that rows of the same group (article) always share a fold"""
+    unique = pd.unique(groups)
+    fold_of = dict(zip(unique, np.random.default_rng(seed).permutation(len(unique)) % n_folds))
+    return np.array([fold_of[group] for group in groups])
+
+def cross_validate(df, column, folds):
+    """returns out-of-fold (labels, confidence) for every row, training on the other folds"""
+    labels = np.empty(len(df), dtype=object)
+    confidence = np.empty(len(df))
+    for fold in np.unique(folds):
+        train, test = folds != fold, folds == fold
+        labeller = LinearLabeler().fit(df.loc[train, 'sentence'].tolist(), df.loc[train, column].tolist())
+        labels[test], confidence[test] = labeller.predict(df.loc[test, 'sentence'].tolist())
+    return labels, confidence
+
+def report(truth, labels, confidence, levels=CONFIDENCE_LEVELS):
+    """prints accuracy, macro F1 and the accuracy of the suggestions at or above each confidence level"""
+    truth = np.asarray(truth, dtype=object)
+    correct = labels == truth
+    f1 = []
+    for label in np.unique(truth):
+        tp = np.sum(correct & (truth == label))
+        predicted, actual = np.sum(labels == label), np.sum(truth == label)
+        f1.append(2 * tp / (predicted + actual) if predicted + actual else 0)
+    majority = pd.Series(truth).value_counts().iloc[0] / len(truth)
+    print(f'  accuracy {correct.mean():.1%} (majority class {majority:.1%}), macro F1 {np.mean(f1):.3f}')
+    for level in levels:
+        confident = confidence >= level
+        if confident.any():
+            print(f'  confidence >= {level:.1f}: {confident.mean():6.1%} of rows, {correct[confident].mean():.1%} correct')
+
+def evaluate(df, columns=LABEL_COLUMNS, n_folds=N_FOLDS):
+    """cross-validates each label column by article, then by publication (train on two files, test on the third)"""
+    for column in columns:
+        labelled = df[df[column].notna()].reset_index(drop=True)
+        print(f'{column} ({len(labelled)} labelled sentences)')
+
+        print(f'{n_folds}-fold cross-validation, grouped by article:')
+        labels, confidence = cross_validate(labelled, column, group_folds(labelled['url'].to_numpy(), n_folds))
+        report(labelled[column], labels, confidence)
+
+        print('leave one publication out:')
+        labels, confidence = cross_validate(labelled, column, labelled['path'].to_numpy())
+        for path in labelled['path'].unique():
+            rows = (labelled['path'] == path).to_numpy()
+            print(f' {path}')
+            report(labelled.loc[rows, column], labels[rows], confidence[rows])
+        print()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Suggest victim/responsible labels with confidences, trained on the labelled sentences.')
+    parser.add_argument('command', choices=['evaluate', 'label'])
+    parser.add_argument('paths', nargs='*', default=unlabelled_paths, help='label: sentence csvs to add suggestions to (default: data/*_sentences_raw.csv)')
+    parser.add_argument('--labelled', nargs='+', default=labelled_paths, help='hand-labelled csvs to train (and evaluate) on')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='label: flag rows with a suggestion below this confidence for review')
+    parser.add_argument('--write', action='store_true', help='label: save the suggestions back to each csv')
+    args = parser.parse_args()
+
+    df = load_labelled(args.labelled)
+    if args.command == 'evaluate':
+        evaluate(df)
+    else:
+        if not args.paths:
+            parser.error('no sentence csvs to label (run extract_sentences.py first, or pass paths)')
+        start = time.perf_counter()
+        labellers = fit_labellers(df)
+        print(f'Trained on {len(df)} labelled sentences in {time.perf_counter() - start:.1f}s')
+
+        for path in args.paths:
+            sentences = pd.read_csv(path, index_col=0)
+            start = time.perf_counter()
+            suggested = suggest_labels(sentences, labellers, args.threshold)
+            elapsed = time.perf_counter() - start
+            print(f'{path}: {len(suggested)} sentences labelled in {elapsed:.2f}s ({len(suggested) / max(elapsed, 1e-9):.0f}/s), '
+                  f"{suggested['needs_review'].sum()} below {args.threshold} confidence need review")
+            if args.write:
+                suggested.to_csv(path)
+                print(f'Saved to {path}')
@@ -1,26 +1,89 @@
 #!/usr/bin/env python
 # coding: utf-8
 """
-Uses BeautifulSoup and Selenium to scrape metadata for all articles on the Globe and Mail's "Israel-Hamas war" topic page. 
+Scrapes metadata for all articles on the Globe and Mail's "Israel-Hamas war" topic page.
+The topic feed's paginated fragments are requested directly over HTTP (newest first), and each batch of cards is parsed and
+appended to a temporary csv as it arrives, stopping at the first card older than the start of the date window; the csv
+replaces the article list only once the scrape is complete. `--feed-url` points the scraper at another copy of the feed,
+e.g. the synthetic fixture pages served locally. If the feed runs out before reaching the start of the window (a missing
+page, or one with no new cards, as when the site ignores the page number), or with `--selenium`, the original
+BeautifulSoup and Selenium "load more" click loop is used instead.
 NOTE: The topic page now prevents scrolling to the beginning of the topic. Scraping was initially done on Nov. 27th, 2023 before this was an issue.
 """
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.common.by import By
+import os
+import argparse
+import itertools
 import time
-from bs4 import BeautifulSoup
 import datetime
+import requests
 import pandas as pd
+from bs4 import BeautifulSoup
+from cache import get_html, add_cache_args, configure_from_args, OfflineCacheMiss
+from client import client
+from metrics import metrics, add_metrics_args, configure_metrics_from_args
+from article_stage import Page
+from parsing import parse
 
 GLOBE_URL = 'https://www.theglobeandmail.com'
 TOPIC_URL = 'https://www.theglobeandmail.com/topics/israel-hamas-war/'
+FEED_URL = TOPIC_URL + '?page={page}' # feed fragments are numbered from 0, newest first
 
 save_csv = False
 filename = '../data/globe_article_list.csv'
 
-if __name__ == "__main__":
+date_start = '2023-10-07'
+COLUMNS = ['datetime', 'title', 'tag', 'url']
+
+
+def card_rows(cards):
+    """turns parsed (datetime, title, href, tag) cards into article list rows"""
+    return [(pd.Timestamp(datetime.datetime.fromisoformat(date_string[:-1])), title, tag, GLOBE_URL + href)
+            for date_string, title, href, tag in cards]
+
+class IncompleteFeed(RuntimeError):
+    """raised when the feed runs out before reaching the start of the date window"""
+
+
+def feed_batches(feed_url=FEED_URL, start=date_start):
+    """
+    Yields the rows of each feed fragment from newest to oldest, stopping after the first fragment that reaches back past
+    `start` (older cards are dropped). Raises IncompleteFeed if the feed runs out first: a missing page, or a page with no
+    cards we haven't seen (e.g. the same page served again because the site ignores the page number).
+    """
+    start = pd.Timestamp(start)
+    seen = set()
+    for page in itertools.count():
+        url = feed_url.format(page=page)
+        try:
+            # the feed changes, so fragments are always refetched (or replayed as recorded with --offline)
+            html = get_html(url, raise_for_status=True, refresh=True)
+        except (requests.HTTPError, OfflineCacheMiss) as error:
+            raise IncompleteFeed(f'The feed ended at page {page} before reaching {start:%Y-%m-%d} ({error})')
+
+        rows = [row for row in card_rows(parse('globe_cards', Page(url, html))) if row[3] not in seen]
+        if not rows:
+            raise IncompleteFeed(f'Page {page} of the feed had no new cards before reaching {start:%Y-%m-%d}')
+        seen.update(row[3] for row in rows)
+        metrics.count('globe.feed_pages')
+
+        yield [row for row in rows if row[0] >= start]
+        if min(row[0] for row in rows) < start:
+            return
+
+def append_rows(rows, path):
+    """appends rows to the article list csv, keeping the millisecond timestamps of a full write"""
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df['datetime'] = df['datetime'].dt.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3]
+    df.to_csv(path, mode='a', header=False, index=False)
+
+def scrape_with_selenium():
+    """clicks "load more" on the topic page until it disappears and returns every card on it as a dataframe"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.common.exceptions import NoSuchElementException
+    from selenium.webdriver.common.by import By
+
     # set selenium options and launch webdriver
     options = Options()
     b = webdriver.Chrome(options=options)
@@ -64,17 +127,63 @@ if __name__ == "__main__":
     url_list = []
     tag_list = []
 
-    for article in articles: 
+    for article in articles:
         date_string = article.find('time')['datetime']
         date_list.append(pd.Timestamp(datetime.datetime.fromisoformat(date_string[:-1])))
         title_list.append(article.find('div', class_='c-card__hed-text text-pb-9').text)
         url_list.append(GLOBE_URL + article.find('a')['href'])
         tag_list.append(article.find('span').text)
 
-    # compile dataframe and save
-    df = pd.DataFrame({'datetime': date_list, 'title': title_list, 'tag': tag_list, 'url': url_list})
-    print(f'Scraped metadata for {len(df)} articles')
+    return pd.DataFrame({'datetime': date_list, 'title': title_list, 'tag': tag_list, 'url': url_list})
+
+def scrape(path=None, feed_url=FEED_URL, start=date_start, selenium=False):
+    """
+    Scrapes the article list, saving it to `path` if given, and returns the number of articles. Rows are written to
+    `path` + '.tmp' as each fragment arrives, so an interrupted run keeps what it fetched, and the published list is
+    only replaced once the scrape has finished.
+    """
+    tmp_path = None if path is None else path + '.tmp'
+    n_articles = 0
+    if not selenium:
+        try:
+            if tmp_path is not None:
+                pd.DataFrame(columns=COLUMNS).to_csv(tmp_path, index=False)
+            for page, rows in enumerate(feed_batches(feed_url, start), 1):
+                if tmp_path is not None:
+                    append_rows(rows, tmp_path)
+                n_articles += len(rows)
+                print(f'Page {page}: {n_articles} articles so far')
+        except IncompleteFeed as error:
+            print(f'{error}, falling back to the Selenium click loop')
+            selenium = True
+
+    if selenium:
+        df = scrape_with_selenium()
+        n_articles = len(df)
+        if tmp_path is not None:
+            df.to_csv(tmp_path, index=False)
 
+    if tmp_path is not None:
+        os.replace(tmp_path, path)
+    return n_articles
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape the Globe and Mail's Israel-Hamas war topic feed for article metadata.")
+    parser.add_argument('--feed-url', default=FEED_URL, help='feed fragment url with a {page} placeholder (e.g. the fixture pages on a local server)')
+    parser.add_argument('--start', default=date_start, help='stop at the first article older than this date')
+    parser.add_argument('--selenium', action='store_true', help='use the browser "load more" click loop instead of fetching the feed')
+    add_cache_args(parser)
+    add_metrics_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_metrics_from_args(args)
+
+    n_articles = scrape(filename if save_csv else None, args.feed_url, args.start, args.selenium)
+
+    print(f'Scraped metadata for {n_articles} articles')
     if save_csv:
-        df.to_csv(filename, index=False)
-        print(f'Saved to {filename}')
\ No newline at end of file
+        print(f'Saved to {filename}')
+
+    client.print_stats()
+    metrics.print_summary()
+    metrics.close()
@@ -5,23 +5,24 @@ Uses BeautifulSoup to scrape metadata for National Post articles relevant to the
 NOTE: The "start_results" were manually specified on Dec 14th, 2023. If running later, this will require adjustment.
 """
 
-import requests
-import time
+import argparse
 import re
-import string
 import pandas as pd
 from tqdm import tqdm
 from bs4 import BeautifulSoup
-from newspaper import Article
-import nltk
-from nltk.stem import WordNetLemmatizer 
-import math
 import datetime
+from cache import get_html, add_cache_args, configure_from_args
+from client import client
+from metrics import metrics, add_metrics_args, configure_metrics_from_args
+from crawl_index import CrawlIndex, append_new_rows
+from article_stage import Page
+from parsing import parse
 
 POST_URL = 'https://nationalpost.com'
 
 save_csv = False
 filename = '../data/post_article_list.csv'
+index_filename = '../data/post_crawl_index.json'
 
 keywords = ['israel', 'hamas', 'gaza', 'palestine', 'palestinian']
 date_start = '2023-10-07'
@@ -38,17 +39,24 @@ keep_tags = ['News',
 # could just start at 0 but that would search the entire post archive and take ages
 start_results = [1930, 340, 510, 280, 960]
 
-# the post needs user-agent for requests
-user_agent_header = {
-    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36",
-    "Accept-Encoding": "gzip, deflate",
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
-    "Accept-Language": "en"
-    }
-
 if __name__ == "__main__":
-    with requests.Session() as se:
-        se.headers = user_agent_header
+    parser = argparse.ArgumentParser(description='Scrape National Post search results for article metadata.')
+    parser.add_argument('--incremental', action='store_true', help='only fetch search results newer than the last run and append them to the article list')
+    add_cache_args(parser)
+    add_metrics_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_metrics_from_args(args)
+
+    # incremental runs walk the newest results first and stop at the first page with nothing new
+    sort = 'asc'
+    if args.incremental:
+        index = CrawlIndex(index_filename)
+        sort = 'desc'
+        start_results = [0] * len(keywords)
+        date_end = datetime.datetime.now().isoformat()
+        new_urls = {keyword: [] for keyword in keywords}
+        new_dates = {keyword: [] for keyword in keywords}
 
     date_list = []
     title_list = []
@@ -56,10 +64,10 @@ if __name__ == "__main__":
     tag_list = []
 
     for keyword, start_result in zip(keywords, start_results):
-            search_url = f'https://nationalpost.com/search/?search_text={keyword}&date_range=-365d&sort=asc&from={start_result}'
+            search_url = f'https://nationalpost.com/search/?search_text={keyword}&date_range=-365d&sort={sort}&from={start_result}'
 
             # make soup for first page
-            html_text = se.get(search_url).text
+            html_text = get_html(search_url, refresh=args.incremental)
             soup = BeautifulSoup(html_text, 'lxml')
 
             # get number of search results
@@ -75,22 +83,21 @@ if __name__ == "__main__":
             pbar = tqdm(range(n_pages - start_page + 1), desc=description)
 
             for i in pbar:
-                    result_url = f'https://nationalpost.com/search/?search_text={keyword}&date_range=-365d&sort=asc&from={start_result + (i * results_per_page)}'
+                    result_url = f'https://nationalpost.com/search/?search_text={keyword}&date_range=-365d&sort={sort}&from={start_result + (i * results_per_page)}'
 
-                    # make soup
-                    html_text = se.get(result_url).text
-                    soup = BeautifulSoup(html_text, 'lxml')
+                    html_text = get_html(result_url, refresh=args.incremental)
                     
-                    # get all article info
-                    articles = soup.find_all('div', class_='article-card__details')
+                    # get all article info (only the result cards are parsed)
+                    cards = parse('post_cards', Page(result_url, html_text))
+                    n_before = len(url_list)
 
-                    for article in articles:
-                            title_list.append(article.find('span', class_='article-card__headline-clamp').text)
-                            url_list.append(POST_URL + article.find('a')['href'])
-                            tag_list.append(article.find('span', {'data-evt-skip-click': 'true'}).text)
+                    for title, href, tag, date_string in cards:
+                            title_list.append(title)
+                            url_list.append(POST_URL + href)
+                            tag_list.append(tag)
 
                             # dates are in recency-dependent strings
-                            date_string = article.find('span', class_='article-card__time-clamp').text.replace(',', '')
+                            date_string = date_string.replace(',', '')
                             if date_string.find('day') != -1:
                                     days_ago = int(re.search(r'\d+', date_string).group())
                                     date = pd.Timestamp(datetime.datetime.now() - datetime.timedelta(days=days_ago + 1))
@@ -104,10 +111,21 @@ if __name__ == "__main__":
                                     date = pd.Timestamp(datetime.datetime.strptime(date_string, ' %B %d %Y '))
                             date_list.append(date)
 
+                    # newest results come first, so once a page has nothing new the rest won't either
+                    if args.incremental:
+                            page_urls, page_dates = url_list[n_before:], date_list[n_before:]
+                            new_urls[keyword] += page_urls
+                            new_dates[keyword] += page_dates
+                            if index.page_is_stale(page_urls, page_dates, keyword):
+                                    break
+
             description = f'Scraped {n_results - start_result} search results for keyword: "{keyword}"'
             pbar.set_description(description)
 
     df = pd.DataFrame({'datetime': date_list, 'title': title_list, 'tag': tag_list, 'url': url_list}).drop_duplicates()
+    if args.incremental:
+        df = df[~df['url'].isin(index.seen_urls)]
+        print(f'{len(df)} new search results since the last run')
     df = df[df['datetime'] >= date_start]
     df = df[df['datetime'] <= date_end]
     df.sort_values(by='datetime', inplace=True)
@@ -125,6 +143,16 @@ if __name__ == "__main__":
     df.reset_index(drop=True, inplace=True)
     print(f'Scraped metadata for {len(df)} articles')
 
-    if save_csv:
+    if save_csv and args.incremental:
+        new = append_new_rows(df, filename, index=True)
+        for keyword in keywords:
+            index.update(keyword, new_urls[keyword], new_dates[keyword])
+        index.save()
+        print(f'Appended {len(new)} new articles to {filename}')
+    elif save_csv:
         df.to_csv(filename)
-        print(f'Saved to {filename}')
\ No newline at end of file
+        print(f'Saved to {filename}')
+
+    client.print_stats()
+    metrics.print_summary()
+    metrics.close()
\ No newline at end of file
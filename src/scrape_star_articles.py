@@ -4,23 +4,27 @@
 Uses BeautifulSoup to scrape metadata for Toronto Star articles relevant to the war on Gaza. 
 """
 
-import requests
-import time
+import argparse
 import re
 import string
 import pandas as pd
 from tqdm import tqdm
 from bs4 import BeautifulSoup
-from newspaper import Article
-import nltk
-from nltk.stem import WordNetLemmatizer 
 import math
 import datetime
+from cache import get_html, add_cache_args, configure_from_args
+from client import client
+from metrics import metrics, add_metrics_args, configure_metrics_from_args, failure_reason
+from crawl_index import CrawlIndex, append_new_rows
+from extractors import star_stage
+from article_stage import Page
+from parsing import parse
 
 STAR_URL = 'https://www.thestar.com'
 
 save_csv = False
 filename = '../data/star_article_list.csv'
+index_filename = '../data/star_crawl_index.json'
 
 keywords = ['israel', 'hamas', 'gaza', 'palestinian', 'palestine']
 date_start = '2023-10-07'
@@ -34,6 +38,21 @@ keep_tags = ['Canada',
              'Opinion']
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scrape Toronto Star search results for article metadata.')
+    parser.add_argument('--incremental', action='store_true', help='only fetch search results newer than the last run and append them to the article list')
+    add_cache_args(parser)
+    add_metrics_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    configure_metrics_from_args(args)
+
+    # incremental runs search up to today and stop paginating at the first page with nothing new
+    if args.incremental:
+        index = CrawlIndex(index_filename)
+        date_end = datetime.date.today().isoformat()
+        new_urls = {keyword: [] for keyword in keywords}
+        new_dates = {keyword: [] for keyword in keywords}
+
     # loop through search results for every keyword
     results_per_page = 100
     start_result = 0
@@ -46,7 +65,7 @@ if __name__ == "__main__":
         search_url = f'https://www.thestar.com/search/?f=html&q={keyword}&d1={date_start}&d2={date_end}&t=article&s=start_time&sd=desc&l={results_per_page}&nsa=eedition&app%5B0%5D=editorial&o={start_result}'
         
         # make soup for first page
-        html_text = requests.get(search_url).text
+        html_text = get_html(search_url, refresh=args.incremental)
         soup = BeautifulSoup(html_text, 'lxml')
 
         # get number of search results
@@ -62,29 +81,36 @@ if __name__ == "__main__":
             start_result = i * results_per_page
             result_url = f'https://www.thestar.com/search/?f=html&q={keyword}&d1={date_start}&d2={date_end}&t=article&s=start_time&sd=desc&l={results_per_page}&nsa=eedition&app%5B0%5D=editorial&o={start_result}'
 
-            # make soup
-            html_text = requests.get(result_url).text
-            soup = BeautifulSoup(html_text, 'lxml')
+            html_text = get_html(result_url, refresh=args.incremental)
             
-            # get all article info
-            articles = soup.find_all('article')
-
-            for article in articles:
-                article_info = article.find('a', class_='tnt-asset-link')
-                url_list.append(STAR_URL + article_info['href'])
-                title_list.append(article_info['aria-label'])
-                date_string = article.find('time')['datetime']
+            # get all article info (only the result cards are parsed)
+            cards = parse('star_cards', Page(result_url, html_text))
+            n_before = len(url_list)
+
+            for href, title, date_string, tag in cards:
+                url_list.append(STAR_URL + href)
+                title_list.append(title)
                 date_list.append(pd.Timestamp(datetime.datetime.fromisoformat(date_string[:-6])))
+                tag_list.append(tag)
 
-                try:
-                    tag_list.append(article.find('span', class_='tnt-flag').text.replace('\n', ''))
-                except: # some articles have weird tags
-                    tag_list.append(article.find('span').text)
+            # results are newest first, so once a page has nothing new the rest won't either
+            if args.incremental:
+                page_urls, page_dates = url_list[n_before:], date_list[n_before:]
+                new_urls[keyword] += page_urls
+                new_dates[keyword] += page_dates
+                if index.page_is_stale(page_urls, page_dates, keyword):
+                    break
 
         description = f'Scraped {n_results} search results for keyword: "{keyword}"'
         pbar.set_description(description)
 
-    df = pd.DataFrame({'datetime': date_list, 'title': title_list, 'tag': tag_list, 'url': url_list}).drop_duplicates().reset_index(drop=True)
+    # articles found by several keywords are only checked once
+    df = pd.DataFrame({'datetime': date_list, 'title': title_list, 'tag': tag_list, 'url': url_list}).drop_duplicates('url').reset_index(drop=True)
+
+    # only check articles that weren't seen on earlier runs
+    if args.incremental:
+        df = df[~df['url'].isin(index.seen_urls)].reset_index(drop=True)
+        print(f'{len(df)} new search results since the last run')
 
     # try filtering based on relevant metadata keywords (these are an inconsistent mess)
     relevant_keywords = ['gaza', 'gaza_strip', 'gazaisrael_conflict', 'hamas', 'israel', 'israeli', 'israelipalestinian_conflict', 
@@ -92,21 +118,24 @@ if __name__ == "__main__":
                          'war', 'antisemitism', 'jew', 'jewish']
     all_keywords = []
     match_list = [] 
-
-    pbar = tqdm(range(len(df)), desc=f'Checking keywords for {len(df)} articles')
-    for i in pbar:
-        url = df.iloc[i]['url']
-        html_text = requests.get(url).text
-        soup = BeautifulSoup(html_text, 'lxml')
+    failed_urls = set()
+
+    # one fused pass per unique article: the page is fetched and parsed once for the tag, keywords and body text,
+    # and the text is kept for extract_sentences so it doesn't fetch or parse the page again
+    results = star_stage.run(df['url'], desc=f'Checking keywords for {len(df)} articles')
+    for i, (extracted, error) in enumerate(results):
+        if error is not None:
+            print(f"Could not find {df.loc[i, 'url']}. ({failure_reason(error)}: {error})")
+            failed_urls.add(df.loc[i, 'url'])
+            match_list.append(False)
+            continue
 
         # fix article tags while we're here
-        df.loc[i, 'tag'] = soup.find_all('span', {'itemprop': 'name'})[-1].text
-
-        # extract keywords
-        article_keywords_string = soup.find('meta', attrs={'name': 'keywords'})['content']
-        article_keywords = article_keywords_string.replace(',', '').split(' ')
+        if extracted['tag'] is not None:
+            df.loc[i, 'tag'] = extracted['tag']
 
         # check for relevant meta keywords
+        article_keywords = extracted['keywords'] or []
         match = (any(map(lambda v: v in article_keywords, relevant_keywords)))
         
         # if no kw match, check article title
@@ -127,6 +156,17 @@ if __name__ == "__main__":
     df = df.sort_values('datetime').reset_index(drop=True)
     print(f'Scraped metadata for {len(df)} articles')
     
-    if save_csv:
+    if save_csv and args.incremental:
+        new = append_new_rows(df, filename, index=False, fill_values={'kw_match': True})
+        # articles that couldn't be fetched stay unseen, so the next run retries them
+        for keyword in keywords:
+            index.update(keyword, new_urls[keyword], new_dates[keyword], failed_urls)
+        index.save()
+        print(f'Appended {len(new)} new articles to {filename}' + (f', {len(failed_urls)} failed and will be retried' if failed_urls else ''))
+    elif save_csv:
         df.to_csv(filename, index=False)
-        print(f'Saved to {filename}')
\ No newline at end of file
+        print(f'Saved to {filename}')
+
+    client.print_stats()
+    metrics.print_summary()
+    metrics.close()
\ No newline at end of file
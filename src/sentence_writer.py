@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Streams extracted sentences to csv in article order, in batches, with a checkpoint of completed urls so interrupted runs can resume.
+"""
+
+import os
+import hashlib
+import pandas as pd
+
+# categories, terms and offsets are the ';'-separated lexicon matches of each sentence (see extract_sentences.format_matches)
+COLUMNS = ['date', 'title', 'category', 'url', 'sentence', 'categories', 'terms', 'offsets']
+
+
+def sentence_hash(sentence):
+    """returns a compact fixed-size hash used to deduplicate sentences"""
+    return hashlib.blake2b(sentence.encode('utf-8'), digest_size=8).digest()
+
+
+class SentenceWriter:
+    """
+    Appends the fatal sentences of one article list to `path` as articles finish.
+    Articles can finish in any order; rows are written in article list order, so a full run gives the same csv as a serial one.
+    Completed urls are appended to `path`.checkpoint after their rows are written, and duplicate sentences are dropped
+    with a set of sentence hashes (the same rows as `drop_duplicates('sentence')`) instead of keeping every row in memory.
+    With `path` set to None nothing is written and sentences are only counted.
+    """
+
+    def __init__(self, df, path, resume=False, batch_size=20):
+        self.df = df
+        self.path = path
+        self.checkpoint_path = f'{path}.checkpoint' if path else None
+        self.batch_size = batch_size
+
+        self.n_rows = 0
+        self.seen = set()
+        self.completed = set()
+        self.pending = {} # article index -> fatal sentences (None if it failed), waiting for earlier articles
+        self.next_i = 0
+        self.rows = []
+        self.row_urls = []
+
+        if path is None:
+            return
+
+        if resume and os.path.exists(path) and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                self.completed = set(f.read().splitlines())
+
+            # rebuild the dedupe set and row count from what is already written
+            for chunk in pd.read_csv(path, usecols=['sentence'], chunksize=10000):
+                self.seen.update(map(sentence_hash, chunk['sentence']))
+                self.n_rows += len(chunk)
+        else:
+            pd.DataFrame(columns=COLUMNS).to_csv(path)
+            open(self.checkpoint_path, 'w').close()
+
+    def todo(self):
+        """returns the indices of articles that still need to be extracted"""
+        return [i for i, url in enumerate(self.df['url']) if url not in self.completed]
+
+    def add(self, i, fatal_sentences):
+        """records the (sentence, categories, terms, offsets) rows found for article `i` and writes out any articles that are now in order"""
+        self.pending[i] = fatal_sentences
+        self._advance()
+
+    def skip(self, i):
+        """records that article `i` failed, so it isn't checkpointed and is retried on resume"""
+        self.pending[i] = None
+        self._advance()
+
+    def _advance(self):
+        while self.next_i < len(self.df):
+            url = self.df.loc[self.next_i, 'url']
+            if url in self.completed:
+                self.pending.pop(self.next_i, None)
+                self.next_i += 1
+                continue
+            if self.next_i not in self.pending:
+                break
+
+            fatal_sentences = self.pending.pop(self.next_i)
+            if fatal_sentences is not None:
+                for sentence, *matches in fatal_sentences:
+                    key = sentence_hash(sentence)
+                    if key in self.seen:
+                        continue
+                    self.seen.add(key)
+                    self.rows.append((self.df.loc[self.next_i, 'datetime'], self.df.loc[self.next_i, 'title'], self.df.loc[self.next_i, 'tag'], url, sentence, *matches))
+                self.row_urls.append(url)
+            self.next_i += 1
+
+            if len(self.row_urls) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """appends buffered rows to the csv, then marks their articles completed in the checkpoint"""
+        if self.path is not None:
+            if self.rows:
+                batch = pd.DataFrame(self.rows, columns=COLUMNS, index=range(self.n_rows, self.n_rows + len(self.rows)))
+                batch.to_csv(self.path, mode='a', header=False)
+            with open(self.checkpoint_path, 'a') as f:
+                f.writelines(url + '\n' for url in self.row_urls)
+            self.completed.update(self.row_urls)
+
+        self.n_rows += len(self.rows)
+        self.rows = []
+        self.row_urls = []
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Normalized columnar copies of the published csvs. Each publication's sentence csv is split into an articles table
+(article_id, date, title, category, url) and a sentences table (article_id, victim, responsible, sentence), so article
+fields are stored once instead of on every sentence. Low-cardinality strings are dictionary-encoded and dates are typed
+timestamps. Tables are written as Arrow IPC files (read memory-mapped, with no text parsing) or Parquet.
+
+The csvs in data/ stay the published source of truth: the store is rebuilt from them whenever a csv is newer, and
+`python storage.py csv` writes csvs back out of the store (to data/arrow/csv/, so the published csvs are never overwritten).
+"""
+
+import os
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from files import atomic_write
+
+PUBLICATIONS = ['globe', 'star', 'post']
+DATA_DIR = '../data'
+STORE_DIR = '../data/arrow'
+CSV_OUT_DIR = '../data/arrow/csv' # kept apart from the published csvs
+FORMAT = 'arrow' # 'arrow' (memory-mapped Arrow IPC) or 'parquet'
+
+SENTENCE_COLUMNS = ['date', 'title', 'category', 'victim', 'responsible', 'url', 'sentence']
+ARTICLE_COLUMNS = ['date', 'title', 'category', 'url']
+DICTIONARY_COLUMNS = ['category', 'victim', 'responsible', 'tag']
+DATE_COLUMNS = ['date', 'datetime']
+
+
+def csv_path(name, table):
+    """returns the published csv for a publication's 'sentences' or 'article_list' table"""
+    return os.path.join(DATA_DIR, f'{name}_{table}.csv')
+
+def store_path(name, table, fmt=FORMAT):
+    """returns the store file for a publication's 'articles', 'sentences' or 'article_list' table"""
+    return os.path.join(STORE_DIR, f'{name}_{table}.{fmt}')
+
+def has_index_column(path):
+    """returns True if the csv was saved with its (unnamed) pandas index as the first column"""
+    with open(path, encoding='utf-8') as f:
+        return f.readline().startswith(',')
+
+def read_csv(path):
+    """reads a published csv with typed dates"""
+    df = pd.read_csv(path, index_col=0 if has_index_column(path) else None)
+    for column in DATE_COLUMNS:
+        if column in df:
+            df[column] = pd.to_datetime(df[column], format='mixed')
+    return df
+
+
+def normalize_sentences(df):
+    """splits a sentence dataframe into an articles table and a sentences table keyed by article_id"""
+    # a few urls were listed under two dates, so an article is the whole set of article fields
+    article_id = df.groupby(ARTICLE_COLUMNS, sort=False).ngroup().to_numpy()
+    articles = df[ARTICLE_COLUMNS].drop_duplicates().reset_index(drop=True)
+    articles.insert(0, 'article_id', pd.RangeIndex(len(articles), dtype='int32'))
+
+    # sentence-level columns, including any added after labelling (like dedup.py's dup_cluster)
+    sentences = df.drop(columns=ARTICLE_COLUMNS).reset_index(drop=True)
+    sentences.insert(0, 'article_id', article_id.astype('int32'))
+
+    return articles, sentences
+
+def denormalize_sentences(articles, sentences):
+    """joins the articles and sentences tables back into the published sentence csv layout"""
+    df = sentences.join(articles.set_index('article_id'), on='article_id')
+    extra = [column for column in sentences if column not in SENTENCE_COLUMNS and column != 'article_id']
+    return df[SENTENCE_COLUMNS + extra]
+
+
+def to_table(df, index=False):
+    """converts a dataframe to an arrow table, dictionary-encoding the low-cardinality string columns"""
+    df = df.astype({column: 'category' for column in DICTIONARY_COLUMNS if column in df})
+    table = pa.Table.from_pandas(df, preserve_index=index)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'csv_index'] = b'1' if index else b'0'
+    return table.replace_schema_metadata(metadata)
+
+def write_table(table, path, fmt=FORMAT):
+    with atomic_write(path) as tmp_path:
+        if fmt == 'parquet':
+            pq.write_table(table, tmp_path)
+        else:
+            with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+def read_table(path, fmt=FORMAT):
+    """reads a stored table, memory-mapping the file"""
+    if fmt == 'parquet':
+        return pq.read_table(path, memory_map=True)
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+def table_has_index(table):
+    return (table.schema.metadata or {}).get(b'csv_index') == b'1'
+
+
+def export_publication(name, fmt=FORMAT):
+    """writes the normalized articles and sentences tables and the article list of a publication to the store"""
+    articles, sentences = normalize_sentences(read_csv(csv_path(name, 'sentences')))
+    write_table(to_table(articles), store_path(name, 'articles', fmt), fmt)
+    write_table(to_table(sentences), store_path(name, 'sentences', fmt), fmt)
+
+    article_list_path = csv_path(name, 'article_list')
+    article_list = read_csv(article_list_path)
+    write_table(to_table(article_list, index=has_index_column(article_list_path)), store_path(name, 'article_list', fmt), fmt)
+
+def is_stale(name, fmt=FORMAT):
+    """returns True if a publication's store is missing or older than its csvs"""
+    for table, csv_table in [('sentences', 'sentences'), ('articles', 'sentences'), ('article_list', 'article_list')]:
+        path = store_path(name, table, fmt)
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(csv_path(name, csv_table)):
+            return True
+    return False
+
+def load_table(name, table, fmt=FORMAT):
+    """returns one stored table of a publication as a dataframe, rebuilding the store first if its csvs changed"""
+    if is_stale(name, fmt):
+        export_publication(name, fmt)
+    return read_table(store_path(name, table, fmt), fmt).to_pandas()
+
+def load_sentences(name, fmt=FORMAT):
+    """returns a publication's sentences in the published csv layout, with typed dates and categorical labels"""
+    return denormalize_sentences(load_table(name, 'articles', fmt), load_table(name, 'sentences', fmt))
+
+def load_article_list(name, fmt=FORMAT):
+    """returns a publication's article list, with typed dates"""
+    return load_table(name, 'article_list', fmt)
+
+def load_all(fmt=FORMAT):
+    """returns {publication: sentences dataframe} for every publication"""
+    return {name: load_sentences(name, fmt) for name in PUBLICATIONS}
+
+
+def export_csv(name, out_dir=CSV_OUT_DIR, fmt=FORMAT):
+    """writes a publication's sentence csv and article list csv back out of the store"""
+    os.makedirs(out_dir, exist_ok=True)
+    load_sentences(name, fmt).to_csv(os.path.join(out_dir, f'{name}_sentences.csv'))
+
+    table = read_table(store_path(name, 'article_list', fmt), fmt)
+    table.to_pandas().to_csv(os.path.join(out_dir, f'{name}_article_list.csv'), index=table_has_index(table))
+
+def check_round_trip(name, fmt=FORMAT):
+    """returns True if the stored tables give back exactly the rows of the published csvs"""
+    sentences = read_csv(csv_path(name, 'sentences'))
+    article_list = read_csv(csv_path(name, 'article_list'))
+
+    # compare through csv text, so only values (not dtypes) have to match
+    return (load_sentences(name, fmt).to_csv() == sentences.to_csv()
+            and load_article_list(name, fmt).to_csv() == article_list.to_csv())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert the published csvs to and from normalized columnar storage.')
+    parser.add_argument('command', choices=['export', 'csv', 'check'],
+                        help='export: csvs to the store, csv: the store back to csvs, check: verify the store matches the csvs')
+    parser.add_argument('--format', choices=['arrow', 'parquet'], default=FORMAT)
+    parser.add_argument('--out-dir', default=CSV_OUT_DIR, help=f'where `csv` writes csvs (default: {CSV_OUT_DIR}; pass {DATA_DIR} to overwrite the published csvs)')
+    parser.add_argument('publications', nargs='*', default=PUBLICATIONS)
+    args = parser.parse_args()
+
+    for name in args.publications:
+        if args.command == 'export':
+            export_publication(name, args.format)
+            size = sum(os.path.getsize(store_path(name, table, args.format)) for table in ['articles', 'sentences', 'article_list'])
+            print(f'{name}: {size / 1024:.0f} KB in {STORE_DIR}')
+        elif args.command == 'csv':
+            export_csv(name, args.out_dir, args.format)
+            print(f'{name}: csvs written to {args.out_dir}')
+        else:
+            matches = check_round_trip(name, args.format)
+            print(f"{name}: {'round trip ok' if matches else 'store differs from csvs'}")
+            if not matches:
+                raise SystemExit(1)